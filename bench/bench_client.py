@@ -0,0 +1,149 @@
+#бенчмарк WBCourierAPI целиком, без сети и телефона: все запросы идут на bench.mock_server.
+#  throughput - запросов в секунду, p50/p99 задержки на find-free-tasks-by-office при N потоках
+#  refresh    - во сколько обходится запрос, на который сервер ответил 401 (refresh + повтор)
+#  sqlite     - сколько операций с users в секунду выдерживает один файл базы при N процессах
+#запуск: python -m bench.bench_client [--requests 2000] [--threads 1 4 16] [--latency 0.002]
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.mock_server import MockServer, route_to_mock, CODE
+from wbapi.api import WBCourierAPI
+from wbapi.endpoints import COURIER_DELIVERY_API_END_POINT
+from wbapi.store import SQLiteSessionStore
+
+PHONES = ["79990000001", "79990000002", "79990000003", "79990000004"]
+FIND_BY_OFFICE = COURIER_DELIVERY_API_END_POINT.find_free_tasks_by_office
+OFFICE = {"office": "50133438", "sm": ""}
+
+
+def percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report(name: str, latencies: list, elapsed: float):
+    print(f"{name:<28} {len(latencies) / elapsed:>9,.0f} req/s"
+          f"   p50 {percentile(latencies, 0.50) * 1000:>7.2f} ms"
+          f"   p99 {percentile(latencies, 0.99) * 1000:>7.2f} ms")
+
+
+def make_client(server: MockServer, db_path: str, pool_maxsize: int) -> WBCourierAPI:
+    #код подтверждения mock всегда один и тот же
+    api = WBCourierAPI(db_path, pool_maxsize=pool_maxsize, code_provider=lambda challenge: CODE)
+    route_to_mock(api, server.address, pool_maxsize=pool_maxsize)
+    for phone in PHONES:
+        api.auth(phone)
+    return api
+
+
+def timed_call(api: WBCourierAPI, phone: str) -> float:
+    started = time.perf_counter()
+    response = api.call(phone, FIND_BY_OFFICE, OFFICE, headers={"view": "simplify"})
+    elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise ValueError(f"mock ответил {response.status_code}: {response.text}")
+    return elapsed
+
+
+def bench_throughput(server: MockServer, db_path: str, requests_count: int, threads: int):
+    api = make_client(server, db_path, pool_maxsize=threads)
+    try:
+        #прогрев: соединения в пуле, интерцепторы, кэш users
+        for phone in PHONES:
+            timed_call(api, phone)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies = list(executor.map(lambda i: timed_call(api, PHONES[i % len(PHONES)]), range(requests_count)))
+        report(f"throughput, {threads} threads", latencies, time.perf_counter() - started)
+    finally:
+        api.close()
+
+
+def bench_refresh(server: MockServer, db_path: str, requests_count: int):
+    api = make_client(server, db_path, pool_maxsize=1)
+    phone = PHONES[0]
+    try:
+        timed_call(api, phone)
+        plain = [timed_call(api, phone) for _ in range(requests_count)]
+
+        expired = []
+        for _ in range(requests_count):
+            server.state.expire_access()
+            expired.append(timed_call(api, phone))
+
+        overhead = statistics.mean(expired) - statistics.mean(plain)
+        print(f"{'request':<28} mean {statistics.mean(plain) * 1000:>7.2f} ms")
+        print(f"{'request after 401 + refresh':<28} mean {statistics.mean(expired) * 1000:>7.2f} ms"
+              f"   overhead {overhead * 1000:.2f} ms")
+    finally:
+        api.close()
+
+
+#один процесс-писатель: обновление координат + чтение строки мимо кэша + аренда refresh
+def _sqlite_worker(db_path: str, phone: str, operations: int, start_at: float, results):
+    store = SQLiteSessionStore(db_path)
+    owner = f"bench-{os.getpid()}"
+    while time.time() < start_at:
+        time.sleep(0.001)
+    started = time.perf_counter()
+    for i in range(operations):
+        store.update_user(phone, {"latitude": 55.0 + i * 1e-6, "longitude": 37.0})
+        store.get_user(phone)
+        if store.acquire_refresh_lease(phone, owner, 60.0):
+            store.release_refresh_lease(phone, owner)
+    results.put(time.perf_counter() - started)
+    store.close()
+
+
+def bench_sqlite(db_path: str, operations: int, processes: list):
+    store = SQLiteSessionStore(db_path)
+    now = int(time.time())
+    for phone in PHONES:
+        if store.get_user(phone) is None:
+            store.create_user({"phone": phone, "device_uuid": "bench", "device_name": "bench",
+                               "latitude": 55.0, "longitude": 37.0, "created_at": now, "updated_at": now})
+    store.close()
+
+    for count in processes:
+        results = multiprocessing.Queue()
+        start_at = time.time() + 0.5
+        workers = [multiprocessing.Process(target=_sqlite_worker,
+                                           args=(db_path, PHONES[i % len(PHONES)], operations, start_at, results))
+                   for i in range(count)]
+        for worker in workers:
+            worker.start()
+        elapsed = max(results.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+        total = operations * count
+        print(f"sqlite, {count:>2} processes {total / elapsed:>12,.0f} ops/s"
+              f"   ({total} x update+get+lease)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WBCourierAPI benchmarks against the local mock")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка mock на ответ, секунды")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, \
+            MockServer(latency=args.latency, error_rate=args.error_rate) as server:
+        db_path = os.path.join(directory, "bench.db")
+        for threads in args.threads:
+            bench_throughput(server, db_path, args.requests, threads)
+        bench_refresh(server, db_path, max(1, args.requests // 10))
+        bench_sqlite(db_path, args.requests, args.processes)
+        print("mock:", server.state.stats)
+
+
+if __name__ == "__main__":
+    main()
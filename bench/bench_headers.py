@@ -0,0 +1,76 @@
+#микробенчмарк подписи: сколько заголовков в секунду собирает SecurityInterceptor
+#до (новый интерцептор на запрос, как раньше в _get_headers) и после (кэшированный интерцептор)
+#запуск: python -m bench.bench_headers
+import hmac
+import hashlib
+import time
+from wbapi.easyheader import SecurityInterceptor, version_to_number
+
+APP_VERSION = "4.91.2"
+SIGNATURE_VERSION = "6f8f8ea7-0773-4cde-a70e"
+HOST = "courier-delivery-api.wildberries.ru"
+PATH = "/api/v1/delivery/find-free-tasks-by-office?office=50133438&sm="
+TIMESTAMP = 1768837746
+
+
+#старая версия generate_headers, один в один, для сравнения
+def legacy_headers(device_id: str, device_name: str, timestamp: int) -> dict:
+    hmac_secret = "18aaaabd-7299-4be8-a943-166a5fe0753f"
+    timestamp_str = str(timestamp)
+    payload = f"{timestamp_str}{APP_VERSION}{PATH}".encode('utf-8')
+    signature_bytes = hmac.new(hmac_secret.encode('utf-8'), payload, hashlib.sha256).digest()
+    signature = ''.join(f'{b:02x}' for b in signature_bytes)
+    return {
+        "X-COORDINATES": f"{59.1}:{39.6}",
+        "X-APP-VERSION": APP_VERSION,
+        "X-APP-TYPE": "android",
+        "DEVICE-ID": device_id,
+        "DEVICE-NAME": device_name,
+        "DEBUG": "false",
+        "X-WB-COURIER-VERSION-NAME": APP_VERSION,
+        "X-WB-COURIER-VERSION-CODE": str(version_to_number(APP_VERSION)),
+        "X-WB-COURIER-VERSION-ANDROID-ID": device_id,
+        "X-WB-COURIER-VERSION-IS-DEBUG": "false",
+        "X-TIMESTAMP": timestamp_str,
+        "X-SIGNATURE-VERSION": SIGNATURE_VERSION,
+        "X-SIGNATURE": signature,
+        "Host": HOST,
+        "Connection": "Keep-Alive",
+        "Accept-Encoding": "gzip",
+        "User-Agent": "okhttp/4.12.0"
+    }
+
+
+def bench(name: str, func, n: int):
+    start = time.perf_counter()
+    for i in range(n):
+        func(i)
+    elapsed = time.perf_counter() - start
+    rate = n / elapsed
+    print(f"{name:<34} {rate:>12,.0f} headers/s")
+    return rate
+
+
+def main(n: int = 200_000):
+    device_id, device_name = "2340cdbf8163ee03", "huawei p30 pro"
+    cached = SecurityInterceptor(APP_VERSION, SIGNATURE_VERSION, device_id, device_name)
+
+    #результат должен совпадать байт в байт
+    expected = legacy_headers(device_id, device_name, TIMESTAMP)
+    actual = cached.generate_headers(HOST, PATH, 59.1, 39.6, timestamp=TIMESTAMP)
+    assert list(expected.items()) == list(actual.items()), "заголовки разошлись"
+
+    def before(i):
+        #как было: полная сборка заголовков и HMAC с нуля на каждый запрос
+        legacy_headers(device_id, device_name, TIMESTAMP + i)
+
+    def after(i):
+        cached.generate_headers(HOST, PATH, 59.1, 39.6, timestamp=TIMESTAMP + i)
+
+    old = bench("before (rebuild per call)", before, n)
+    new = bench("after (cached interceptor)", after, n)
+    print(f"speedup: x{new / old:.2f}")
+
+
+if __name__ == "__main__":
+    main()
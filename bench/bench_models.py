@@ -0,0 +1,81 @@
+#разбор большого списка заданий: response.json() целиком против записей со __slots__
+#и потокового разбора по кускам тела. время и пик памяти (tracemalloc) на один ответ
+#запуск: python -m bench.bench_models [--tasks 20000]
+import argparse
+import json
+import time
+import tracemalloc
+
+from wbapi.models import record, find_array, loads, iter_json_array, orjson
+
+Task = record("Task", ("id", "taskUid", "price", "address"))
+
+
+def make_response(count: int) -> bytes:
+    tasks = [{
+        "id": index,
+        "taskUid": f"{index:032x}",
+        "price": 150 + index % 300,
+        "address": "Москва, ул. Тестовая, д. 1, кв. 2",
+        "latitude": 55.75 + index * 1e-6,
+        "longitude": 37.61 + index * 1e-6,
+        "office": {"id": 50133438, "name": "ПВЗ Тестовый", "schedule": ["09:00", "21:00"]},
+        "items": [{"shk": 10000000 + index * 3 + i, "weight": 1.25, "volume": 0.004} for i in range(3)],
+        "comment": "",
+    } for index in range(count)]
+    return json.dumps({"data": tasks, "total": count}, ensure_ascii=False).encode('utf-8')
+
+
+def chunks(body: bytes, size: int = 64 * 1024):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+#как сейчас: response.json() и словари целиком
+def full_dicts(body: bytes):
+    return [(task["id"], task["price"]) for task in json.loads(body)["data"]]
+
+
+#целиком, но быстрым бэкендом и в компактные записи
+def full_records(body: bytes):
+    return [Task.from_dict(task) for task in find_array(loads(body), "data")]
+
+
+#по одному заданию, тело не разбирается целиком
+def streamed(body: bytes):
+    best = None
+    for task in iter_json_array(chunks(body), "data", Task):
+        if best is None or task.price > best.price:
+            best = task
+    return best
+
+
+def measure(name: str, func, body: bytes, repeat: int = 3):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func(body)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    tracemalloc.start()
+    result = func(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+
+    print(f"{name:<30} {elapsed * 1000:>9.1f} ms   peak {peak / 2 ** 20:>8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=20000)
+    args = parser.parse_args()
+
+    body = make_response(args.tasks)
+    print(f"{args.tasks} заданий, {len(body) / 2 ** 20:.1f} MiB JSON, orjson: {'да' if orjson else 'нет'}")
+    measure("json.loads -> dicts", full_dicts, body)
+    measure("loads -> __slots__ records", full_records, body)
+    measure("streamed records", streamed, body)
+
+
+if __name__ == "__main__":
+    main()
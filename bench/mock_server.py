@@ -0,0 +1,280 @@
+#локальная замена r-point.wb.ru и courier-delivery-api.wildberries.ru для бенчмарков.
+#проверяет X-SIGNATURE так же, как его считает SecurityInterceptor, выдает и ротирует токены,
+#умеет задержку и случайные 5xx. клиента на него переключает MockAdapter - хост в URL остается настоящим,
+#меняется только адрес подключения, поэтому подпись и заголовок Host те же, что в проде
+#запуск отдельно: python -m bench.mock_server --port 8080 --latency 0.01 --error-rate 0.05
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlunsplit, parse_qs
+
+from requests.adapters import HTTPAdapter
+
+HMAC_SECRET = "18aaaabd-7299-4be8-a943-166a5fe0753f"
+CODE = "1234"
+
+
+class MockState:
+    #latency: задержка каждого ответа в секундах, error_rate: доля ответов 503
+    #access_ttl / refresh_ttl: время жизни выдаваемых токенов
+    #max_skew: на сколько секунд X-TIMESTAMP может расходиться с часами сервера
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, access_ttl: int = 3600,
+                 refresh_ttl: int = 30 * 24 * 3600, max_skew: int = 300):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.max_skew = max_skew
+        self.access = {}
+        self.refresh = {}
+        self.validation = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "bad_signature": 0, "unauthorized": 0, "errors": 0,
+                      "logins": 0, "refreshes": 0}
+
+    def count(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
+
+    def issue_tokens(self, phone: str) -> dict:
+        access, refresh = uuid.uuid4().hex, uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.access[access] = (phone, now + self.access_ttl)
+            self.refresh[refresh] = (phone, now + self.refresh_ttl)
+        return {"access": {"token": access, "ttl": self.access_ttl},
+                "refresh": {"token": refresh, "ttl": self.refresh_ttl}}
+
+    #все access токены протухают: следующий запрос получит 401 и пойдет в refresh
+    def expire_access(self):
+        with self.lock:
+            self.access.clear()
+
+    def phone_for(self, authorization: str):
+        if not authorization or not authorization.startswith("Bearer "):
+            return None
+        with self.lock:
+            entry = self.access.get(authorization[len("Bearer "):])
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+
+def signature_ok(headers, path: str, max_skew: int) -> bool:
+    timestamp = headers.get("X-TIMESTAMP", "")
+    app_version = headers.get("X-APP-VERSION", "")
+    if not timestamp.isdigit() or abs(int(timestamp) - time.time()) > max_skew:
+        return False
+    expected = hmac.new(HMAC_SECRET.encode('utf-8'), f"{timestamp}{app_version}{path}".encode('utf-8'),
+                        hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, headers.get("X-SIGNATURE", ""))
+
+
+def free_tasks(count: int = 20) -> list:
+    return [{"id": index, "taskUid": uuid.UUID(int=index).hex, "price": 100 + index,
+             "address": "Москва, ул. Тестовая, д. 1"} for index in range(count)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    #заголовки и тело ответа уходят одним пакетом, иначе Nagle + delayed ACK добавляют ~40 мс на запрос
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+    state: MockState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _handle(self, method: str):
+        state = self.state
+        state.count("requests")
+        body = self._body() if method == "POST" else {}
+
+        if state.latency:
+            time.sleep(state.latency)
+        if state.error_rate and random.random() < state.error_rate:
+            state.count("errors")
+            return self._reply(503, {"error": "service unavailable"})
+        if not signature_ok(self.headers, self.path, state.max_skew):
+            state.count("bad_signature")
+            return self._reply(403, {"error": "bad signature"})
+
+        host = self.headers.get("Host", "")
+        path = urlsplit(self.path).path
+        route = ROUTES.get((method, host, path))
+        if route is None:
+            return self._reply(404, {"error": f"no route {method} {host}{path}"})
+
+        handler, needs_auth = route
+        phone = None
+        if needs_auth:
+            phone = state.phone_for(self.headers.get("Authorization"))
+            if phone is None:
+                state.count("unauthorized")
+                return self._reply(401, {"error": "unauthorized"})
+        status, payload = handler(state, phone, body, parse_qs(urlsplit(self.path).query))
+        self._reply(status, payload)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def login(state, phone, body, query):
+    state.count("logins")
+    token = uuid.uuid4().hex
+    with state.lock:
+        state.validation[token] = body.get("phone")
+    return 200, {"data": token, "code_length": len(CODE)}
+
+
+def validate(state, phone, body, query):
+    with state.lock:
+        phone = state.validation.pop(body.get("token"), None)
+    if phone is None or body.get("code") != CODE:
+        return 400, {"error": "invalid code"}
+    return 200, state.issue_tokens(phone)
+
+
+def refresh(state, phone, body, query):
+    with state.lock:
+        entry = state.refresh.pop(body.get("token"), None)
+    if entry is None or entry[1] < time.time():
+        return 401, {"error": "invalid refresh token"}
+    state.count("refreshes")
+    return 200, state.issue_tokens(entry[0])
+
+
+def logout(state, phone, body, query):
+    return 200, {}
+
+
+def find_free_tasks(state, phone, body, query):
+    return 200, {"data": free_tasks()}
+
+
+def tasks_by_assignee(state, phone, body, query):
+    return 200, {"data": free_tasks(5)}
+
+
+R_POINT = "r-point.wb.ru"
+DELIVERY = "courier-delivery-api.wildberries.ru"
+
+#(метод, Host, путь) => (обработчик, нужен ли Authorization)
+ROUTES = {
+    ("POST", R_POINT, "/wbc/api/v1/login"): (login, False),
+    ("POST", R_POINT, "/wbc/api/v1/courier/validate"): (validate, False),
+    ("POST", R_POINT, "/wbc/api/v1/courier/refresh"): (refresh, False),
+    ("POST", R_POINT, "/wbc/api/v1/logout"): (logout, True),
+    ("GET", DELIVERY, "/api/v1/delivery/find-free-tasks-by-office"): (find_free_tasks, True),
+    ("GET", DELIVERY, "/api/v1/delivery/find-free-tasks-by-coords"): (find_free_tasks, True),
+    ("GET", DELIVERY, "/api/v1/delivery/tasks-get-by-assignee"): (tasks_by_assignee, True),
+}
+
+
+class MockServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **options):
+        self.state = MockState(**options)
+        handler = type("BoundMockHandler", (MockHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.address = f"http://{host}:{self.httpd.server_port}"
+        self._thread = None
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="wb-mock", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+#адаптер requests: шлет запрос на mock вместо настоящего хоста. путь, query и заголовки
+#(включая подписанный Host) не меняются, поэтому клиент работает так же, как с продом
+class MockAdapter(HTTPAdapter):
+    def __init__(self, address: str, **kwargs):
+        self.address = urlsplit(address)
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        parsed = urlsplit(request.url)
+        request.url = urlunsplit((self.address.scheme, self.address.netloc, parsed.path, parsed.query, ""))
+        return super().send(request, **kwargs)
+
+
+#переключить WBCourierAPI на mock: весь трафик, и https, и http, идет на address
+def route_to_mock(api, address: str, pool_maxsize: int = 10):
+    adapter = MockAdapter(address, pool_connections=4, pool_maxsize=pool_maxsize)
+    api.session.mount("https://", adapter)
+    api.session.mount("http://", adapter)
+    return adapter
+
+
+#то же для AsyncWBCourierAPI: транспорт httpx подменяет только адрес подключения
+def route_async_to_mock(api, address: str):
+    import httpx
+
+    target = urlsplit(address)
+
+    class MockTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            request.url = request.url.copy_with(scheme=target.scheme, host=target.hostname, port=target.port)
+            return await super().handle_async_request(request)
+
+    api.session._transport = MockTransport(limits=api._limits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mock WB courier API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--access-ttl", type=int, default=3600)
+    args = parser.parse_args()
+
+    server = MockServer(args.host, args.port, latency=args.latency, error_rate=args.error_rate,
+                        access_ttl=args.access_ttl)
+    print(f"mock WB API на {server.address}, код подтверждения {CODE}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.state.stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
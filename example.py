@@ -1,4 +1,9 @@
+import logging
 from wbapi.api import *
+from wbapi.endpoints import COURIER_DELIVERY_API_END_POINT
+
+#сообщения библиотеки (отправка кода, обновление токенов) идут через logging
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 
 t_num = "78005553535"
 
@@ -29,10 +34,9 @@ def FindTaskByOffice():
     latitude = inf["latitude"]
     longitude = inf["longitude"]
     
-    resp = api.request_with_query(
+    resp = api.call(
         t_num, 
-        "GET", 
-        "https://courier-delivery-api.wildberries.ru/api/v1/delivery/find-free-tasks-by-office",
+        COURIER_DELIVERY_API_END_POINT.find_free_tasks_by_office,
         {
             "office":"50133438",
             "sm":""
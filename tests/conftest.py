@@ -0,0 +1,48 @@
+#общие фикстуры: у каждого теста свой mock (bench.mock_server) и своя база во временной папке.
+#запуск из корня репозитория: python -m pytest -q
+import pytest
+
+from bench.mock_server import MockServer, route_to_mock, CODE
+from wbapi.api import WBCourierAPI
+
+PHONE = "79990000001"
+
+
+@pytest.fixture
+def server():
+    #небольшая задержка, чтобы одновременные запросы действительно пересекались
+    with MockServer(latency=0.005) as srv:
+        yield srv
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "wb.db")
+
+
+@pytest.fixture
+def phone():
+    return PHONE
+
+
+#фабрика sync клиентов на mock с уже выполненным входом PHONE. клиенты закрываются после теста
+@pytest.fixture
+def make_api(server, db_path):
+    clients = []
+
+    def make(**options):
+        options.setdefault("pool_maxsize", 16)
+        client = WBCourierAPI(db_path, code_provider=lambda challenge: CODE, **options)
+        route_to_mock(client, server.address, pool_maxsize=options["pool_maxsize"])
+        clients.append(client)
+        client.auth(PHONE)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+@pytest.fixture
+def api(make_api):
+    return make_api()
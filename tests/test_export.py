@@ -0,0 +1,140 @@
+#выгрузка с докачкой: повторный запуск качает только недостающие периоды, каждая строка в результате один раз
+import asyncio
+import json
+import os
+import sqlite3
+from collections import Counter
+from urllib.parse import urlsplit
+
+import pytest
+
+import bench.mock_server as mock
+from bench.mock_server import route_async_to_mock
+from wbapi.async_api import AsyncWBCourierAPI
+from wbapi.endpoints import REG_COMPANY_END_POINT
+from wbapi.retry import RetryPolicy
+
+PAYSLIP = REG_COMPANY_END_POINT.motivation_payslip
+START, END = "2024-01-01", "2024-03-31"
+#13 недельных периодов по 3 строки
+CHUNKS, ROWS = 13, 3
+BROKEN = "2024-02-05"
+
+
+#mock отвечает на payslip строками периода и считает запросы по началу периода. periods из failing - 500
+@pytest.fixture
+def payslip(monkeypatch):
+    url, host, _ = PAYSLIP.prepare(None, None)
+    calls = Counter()
+    failing = set()
+
+    def handler(state, phone, body, query):
+        day = query["from"][0]
+        calls[day] += 1
+        if day in failing:
+            return 500, {"error": "unavailable"}
+        return 200, {"data": [{"day": day, "n": n} for n in range(ROWS)]}
+
+    monkeypatch.setitem(mock.ROUTES, ("GET", host, urlsplit(url).path), (handler, True))
+    return calls, failing
+
+
+@pytest.fixture
+def export_api(make_api):
+    return make_api(retry=RetryPolicy(attempts=1))
+
+
+def read_rows(dest):
+    if dest.endswith(".db"):
+        connection = sqlite3.connect(dest)
+        try:
+            return [json.loads(row) for row, in connection.execute("SELECT data FROM export_rows")]
+        finally:
+            connection.close()
+    with open(dest, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def assert_complete(dest):
+    rows = read_rows(dest)
+    assert len(rows) == CHUNKS * ROWS
+    assert len({(row["day"], row["n"]) for row in rows}) == len(rows)
+
+
+@pytest.mark.parametrize("name", ["out.ndjson", "out.db"])
+def test_resume_fetches_only_missing_chunks(export_api, payslip, phone, tmp_path, name):
+    calls, failing = payslip
+    dest = str(tmp_path / name)
+    failing.add(BROKEN)
+    with pytest.raises(ValueError):
+        export_api.export(phone, PAYSLIP, START, END, dest)
+    assert len(calls) == CHUNKS
+
+    failing.clear()
+    calls.clear()
+    assert export_api.export(phone, PAYSLIP, START, END, dest) == ROWS
+    assert list(calls) == [BROKEN]
+    assert export_api.export(phone, PAYSLIP, START, END, dest) == 0
+    assert_complete(dest)
+
+
+#процесс упал посреди записи: хвост данных и недописанная отметка отрезаются, дублей нет
+def test_ndjson_partial_tail_is_dropped(export_api, payslip, phone, tmp_path):
+    dest = str(tmp_path / "out.ndjson")
+    export_api.export(phone, PAYSLIP, START, END, dest)
+    with open(dest, "ab") as f:
+        f.write(b'{"day": "partial", "n": 0}\n{"da')
+    with open(dest + ".progress", "ab") as f:
+        f.write(b'{"expo')
+
+    assert export_api.export(phone, PAYSLIP, START, END, dest) == 0
+    assert_complete(dest)
+
+
+def test_ndjson_deleted_data_file_is_fetched_again(export_api, payslip, phone, tmp_path):
+    calls, _ = payslip
+    dest = str(tmp_path / "out.ndjson")
+    export_api.export(phone, PAYSLIP, START, END, dest)
+    os.remove(dest)
+
+    calls.clear()
+    assert export_api.export(phone, PAYSLIP, START, END, dest) == CHUNKS * ROWS
+    assert len(calls) == CHUNKS
+    assert_complete(dest)
+
+
+#файл обрезан посреди периода: периоды, чьих строк уже нет, качаются заново, целые остаются
+def test_ndjson_truncated_data_file_restarts_lost_chunks(export_api, payslip, phone, tmp_path):
+    calls, _ = payslip
+    dest = str(tmp_path / "out.ndjson")
+    export_api.export(phone, PAYSLIP, START, END, dest)
+    size = os.path.getsize(dest)
+    os.truncate(dest, size // 2)
+
+    calls.clear()
+    written = export_api.export(phone, PAYSLIP, START, END, dest)
+    assert 0 < len(calls) < CHUNKS
+    assert written == len(calls) * ROWS
+    assert_complete(dest)
+
+
+def test_async_export_resumes(server, export_api, payslip, db_path, phone, tmp_path):
+    calls, failing = payslip
+    dest = str(tmp_path / "out.db")
+
+    async def export():
+        client = AsyncWBCourierAPI(db_path, retry=RetryPolicy(attempts=1))
+        route_async_to_mock(client, server.address)
+        try:
+            return await client.export(phone, PAYSLIP, START, END, dest)
+        finally:
+            await client.close()
+
+    failing.add(BROKEN)
+    with pytest.raises(ValueError):
+        asyncio.run(export())
+    failing.clear()
+    calls.clear()
+    assert asyncio.run(export()) == ROWS
+    assert list(calls) == [BROKEN]
+    assert_complete(dest)
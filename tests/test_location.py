@@ -0,0 +1,147 @@
+#PositionBuffer: порядок записей в хранилище - точка из буфера никогда не ложится поверх более новой
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from wbapi.api import WBCourierAPI
+from wbapi.location import PositionBuffer
+
+
+class Recorder:
+    def __init__(self):
+        self.writes = []
+        self.lock = threading.Lock()
+
+    def __call__(self, phone, data):
+        with self.lock:
+            self.writes.append((phone, data['latitude'], data['longitude']))
+
+
+def test_zero_interval_writes_through():
+    recorder = Recorder()
+    buffer = PositionBuffer(recorder)
+    buffer.update("1", 55, 37)
+    assert recorder.writes == [("1", 55.0, 37.0)]
+    assert buffer.get("1") == (55.0, 37.0)
+
+
+def test_flush_writes_last_point_per_phone():
+    recorder = Recorder()
+    buffer = PositionBuffer(recorder, interval=60)
+    for i in range(5):
+        buffer.update("1", 55 + i, 37)
+    buffer.update("2", 10, 20)
+    assert recorder.writes == []
+    assert buffer.get("1") == (59.0, 37.0)
+
+    assert buffer.flush() == 2
+    assert sorted(recorder.writes) == [("1", 59.0, 37.0), ("2", 10.0, 20.0)]
+    assert buffer.flush() == 0
+    buffer.stop()
+
+
+def test_discard_drops_pending_point():
+    recorder = Recorder()
+    buffer = PositionBuffer(recorder, interval=60)
+    buffer.update("1", 55, 37)
+    buffer.discard("1")
+    assert buffer.get("1") is None
+    buffer.stop()
+    assert recorder.writes == []
+
+
+#discard во время сброса ждет его конца: прямая запись после discard всегда последняя
+def test_discard_waits_for_running_flush():
+    writing, release = threading.Event(), threading.Event()
+    writes = []
+
+    def slow_write(phone, data):
+        writing.set()
+        release.wait(5)
+        writes.append(("buffer", data['latitude']))
+
+    buffer = PositionBuffer(slow_write, interval=60)
+    buffer.update("1", 1, 1)
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    assert writing.wait(5)
+
+    def direct():
+        buffer.discard("1")
+        writes.append(("direct", 2.0))
+
+    discarding = threading.Thread(target=direct)
+    discarding.start()
+    discarding.join(0.2)
+    assert discarding.is_alive()
+
+    release.set()
+    flusher.join(5)
+    discarding.join(5)
+    assert writes == [("buffer", 1.0), ("direct", 2.0)]
+    buffer.stop()
+
+
+#неудачная запись возвращается в очередь, но не затирает точку, пришедшую за время записи
+def test_failed_write_keeps_newer_point():
+    attempts = []
+
+    def failing_write(phone, data):
+        attempts.append(data['latitude'])
+        if len(attempts) == 1:
+            buffer.update("1", 2, 2)
+            raise OSError("disk is busy")
+
+    buffer = PositionBuffer(failing_write, interval=60)
+    buffer.update("1", 1, 1)
+    assert buffer.flush() == 0
+    assert buffer.flush() == 1
+    assert attempts == [1.0, 2.0]
+    buffer.stop()
+
+
+def test_background_thread_and_stop_flush():
+    recorder = Recorder()
+    buffer = PositionBuffer(recorder, interval=0.01)
+    buffer.update("1", 1, 1)
+    deadline = time.monotonic() + 5
+    while not recorder.writes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert recorder.writes == [("1", 1.0, 1.0)]
+
+    buffer.update("1", 2, 2)
+    buffer.stop()
+    assert recorder.writes[-1] == ("1", 2.0, 2.0)
+
+
+def read_position(db_path, phone):
+    api = WBCourierAPI(db_path)
+    try:
+        user = api._get_user(phone)
+        return user['latitude'], user['longitude']
+    finally:
+        api.close()
+
+
+def test_direct_write_overrides_buffered_point(make_api, db_path, phone):
+    api = make_api(coordinates_flush_interval=60)
+    api.update_coordinates(phone, 1, 1)
+    api._update_user(phone, {'latitude': 2.0, 'longitude': 2.0})
+    api.close()
+    assert read_position(db_path, phone) == (2.0, 2.0)
+
+
+#клиент без close(): точки из буфера все равно попадают в базу при выходе из процесса
+def test_unclosed_client_flushes_at_exit(db_path, phone):
+    script = (
+        "import sys\n"
+        "from wbapi.api import WBCourierAPI\n"
+        "api = WBCourierAPI(sys.argv[1], coordinates_flush_interval=60)\n"
+        "api._create_user(sys.argv[2], 'device', 'pixel', 1.0, 1.0)\n"
+        "api.update_coordinates(sys.argv[2], 42.0, 43.0)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", script, db_path, phone], check=True, cwd=root, timeout=60)
+    assert read_position(db_path, phone) == (42.0, 43.0)
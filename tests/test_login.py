@@ -0,0 +1,39 @@
+#вход в два шага: пока код не принят, прежняя сессия телефона продолжает работать
+import pytest
+
+from bench.mock_server import CODE
+from wbapi.endpoints import COURIER_DELIVERY_API_END_POINT
+
+FIND_BY_OFFICE = COURIER_DELIVERY_API_END_POINT.find_free_tasks_by_office
+OFFICE = {"office": "50133438", "sm": ""}
+
+
+def test_abandoned_login_keeps_session(server, api, phone):
+    before = dict(api._get_user(phone))
+    api.start_login(phone, device_uuid="other-device", latitude=1.0, longitude=2.0)
+
+    assert dict(api._get_user(phone)) == before
+    assert api.call(phone, FIND_BY_OFFICE, OFFICE).status_code == 200
+    assert server.state.stats["logins"] == 2
+
+
+def test_rejected_code_keeps_session(api, phone):
+    before = dict(api._get_user(phone))
+    challenge = api.start_login(phone)
+    with pytest.raises(ValueError):
+        api.complete_login(challenge, "0" * challenge.code_length)
+
+    assert dict(api._get_user(phone)) == before
+    assert api.call(phone, FIND_BY_OFFICE, OFFICE).status_code == 200
+
+
+def test_accepted_code_replaces_device_and_tokens(api, phone):
+    before = dict(api._get_user(phone))
+    challenge = api.start_login(phone, device_uuid="other-device", device_name="pixel", latitude=1.0, longitude=2.0)
+    api.complete_login(challenge, CODE)
+
+    user = api._get_user(phone)
+    assert (user['device_uuid'], user['device_name'], user['latitude'], user['longitude']) == \
+        ("other-device", "pixel", 1.0, 2.0)
+    assert user['access_token'] != before['access_token']
+    assert api.call(phone, FIND_BY_OFFICE, OFFICE).status_code == 200
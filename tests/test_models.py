@@ -0,0 +1,82 @@
+#потоковый разбор массива: результат не должен зависеть от того, где сеть разрезала тело на куски
+import json
+
+import pytest
+
+from wbapi.models import JSONArrayParser, iter_json_array, find_array, record
+
+BODIES = [
+    [{"id": 1, "address": "Москва, ул. Тестовая, д. 1", "price": 100.5}, {"id": 2, "tags": ["a", "б"]}],
+    {"total": 3, "meta": {"list": [0]}, "data": [1, 23.5, -4e3, 100, True, False, None], "tail": "x"},
+    [[1, 2], {"nested": {"deep": [3]}}, "строка с \"кавычками\" и \\", 0.001],
+    {"data": []},
+    [],
+]
+
+
+def split(body: bytes, *cuts: int):
+    bounds = (0,) + cuts + (len(body),)
+    return [body[lo:hi] for lo, hi in zip(bounds, bounds[1:])]
+
+
+def parse(chunks, key=None):
+    parser = JSONArrayParser(key)
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items + parser.close()
+
+
+@pytest.mark.parametrize("payload", BODIES)
+def test_every_two_chunk_split(payload):
+    body = json.dumps(payload, ensure_ascii=False, indent=1).encode('utf-8')
+    expected = find_array(payload)
+    #разрезы попадают и в середину чисел, литералов, строк и многобайтовых символов UTF-8
+    for cut in range(len(body) + 1):
+        assert parse(split(body, cut)) == expected, body[:cut]
+
+
+@pytest.mark.parametrize("payload", BODIES)
+def test_byte_by_byte(payload):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    assert parse([body[i:i + 1] for i in range(len(body))]) == find_array(payload)
+
+
+def test_number_on_chunk_edge_waits_for_the_rest():
+    parser = JSONArrayParser()
+    assert parser.feed(b"[3") == []
+    assert parser.feed(b".5") == []
+    assert parser.feed(b", 1") == [3.5]
+    assert parser.feed(b"]") == [1]
+    assert parser.close() == []
+
+
+def test_items_come_out_before_the_array_ends():
+    parser = JSONArrayParser("data")
+    assert parser.feed(b'{"skip": [1, 2], "data": [{"a": 1},') == [{"a": 1}]
+    assert parser.in_array
+    assert parser.feed(b' {"a": 2}]}') == [{"a": 2}]
+    assert parser.close() == []
+
+
+def test_key_skips_other_arrays():
+    body = b'{"other": [1, 2], "data": [3]}'
+    assert parse(split(body, 5, 17), key="data") == [3]
+    assert parse([body]) == [1, 2]
+
+
+def test_truncated_body_raises():
+    with pytest.raises(ValueError):
+        parse([b'[{"a": 1}, {"a"'])
+
+
+def test_missing_key_raises():
+    with pytest.raises(ValueError):
+        parse([b'{"total": 0, "items": [1]}'], key="data")
+
+
+def test_iter_json_array_builds_records():
+    Task = record("Task", {"id": "id", "price": "price"})
+    body = json.dumps({"data": [{"id": i, "price": 100 + i, "extra": "x"} for i in range(5)]}).encode('utf-8')
+    tasks = list(iter_json_array(split(body, 7, 31, 60), "data", Task))
+    assert tasks == [Task(id=i, price=100 + i) for i in range(5)]
@@ -0,0 +1,86 @@
+#single-flight refresh: сколько бы запросов ни получили 401 одновременно, refresh токен тратится один раз -
+#и между потоками, и между процессами на одной базе, и между корутинами
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bench.mock_server import route_to_mock, route_async_to_mock
+from wbapi.api import WBCourierAPI, ReauthRequired
+from wbapi.async_api import AsyncWBCourierAPI
+from wbapi.endpoints import COURIER_DELIVERY_API_END_POINT
+
+FIND_BY_OFFICE = COURIER_DELIVERY_API_END_POINT.find_free_tasks_by_office
+OFFICE = {"office": "50133438", "sm": ""}
+WORKERS = 8
+PROCESSES = 4
+
+
+def test_threads_share_one_refresh(server, api, phone):
+    server.state.expire_access()
+    barrier = threading.Barrier(WORKERS)
+
+    def call(_):
+        barrier.wait()
+        return api.call(phone, FIND_BY_OFFICE, OFFICE).status_code
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        statuses = list(executor.map(call, range(WORKERS)))
+
+    assert statuses == [200] * WORKERS
+    assert server.state.stats["refreshes"] == 1
+
+
+#отдельный процесс со своим клиентом на общей базе
+def _call_in_process(db_path, address, phone, barrier, results):
+    api = WBCourierAPI(db_path)
+    route_to_mock(api, address)
+    try:
+        barrier.wait()
+        results.put(api.call(phone, FIND_BY_OFFICE, OFFICE).status_code)
+    finally:
+        api.close()
+
+
+def test_processes_share_one_refresh(server, api, db_path, phone):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(PROCESSES)
+    results = context.Queue()
+    server.state.expire_access()
+
+    workers = [context.Process(target=_call_in_process, args=(db_path, server.address, phone, barrier, results))
+               for _ in range(PROCESSES)]
+    for worker in workers:
+        worker.start()
+    statuses = [results.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    assert statuses == [200] * PROCESSES
+    assert server.state.stats["refreshes"] == 1
+
+
+def test_coroutines_share_one_refresh(server, api, db_path, phone):
+    async def main():
+        client = AsyncWBCourierAPI(db_path)
+        route_async_to_mock(client, server.address)
+        try:
+            server.state.expire_access()
+            responses = await asyncio.gather(*(client.call(phone, FIND_BY_OFFICE, OFFICE) for _ in range(WORKERS)))
+        finally:
+            await client.close()
+        return [response.status_code for response in responses]
+
+    assert asyncio.run(main()) == [200] * WORKERS
+    assert server.state.stats["refreshes"] == 1
+
+
+def test_rejected_refresh_token_requires_login(server, api, phone):
+    server.state.expire_access()
+    server.state.refresh.clear()
+
+    with pytest.raises(ReauthRequired) as error:
+        api.call(phone, FIND_BY_OFFICE, OFFICE)
+    assert error.value.phone == phone
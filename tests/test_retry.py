@@ -0,0 +1,134 @@
+#повторы и размыкатель: сами политики и то, как клиент ведет их на ответах mock
+import time
+
+import pytest
+import requests
+
+from bench.mock_server import route_to_mock
+from wbapi.endpoints import COURIER_DELIVERY_API_END_POINT
+from wbapi.retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+
+FIND_BY_OFFICE = COURIER_DELIVERY_API_END_POINT.find_free_tasks_by_office
+OFFICE = {"office": "50133438", "sm": ""}
+DELIVERY = "courier-delivery-api.wildberries.ru"
+LOGOUT = "https://r-point.wb.ru/wbc/api/v1/logout"
+
+
+def test_retry_status_by_method():
+    policy = RetryPolicy(attempts=3)
+    assert policy.retry_status("GET", 503, 0)
+    assert policy.retry_status("GET", 503, 1)
+    assert not policy.retry_status("GET", 503, 2)
+    assert not policy.retry_status("GET", 404, 0)
+    #POST мог уже выполниться на сервере - повторяем только 429
+    assert not policy.retry_status("POST", 503, 0)
+    assert policy.retry_status("POST", 429, 0)
+
+
+def test_retry_error_by_method():
+    policy = RetryPolicy(attempts=2)
+    assert policy.retry_error("GET", False, 0)
+    assert not policy.retry_error("POST", False, 0)
+    assert policy.retry_error("POST", True, 0)
+    assert not policy.retry_error("GET", True, 1)
+
+
+def test_delay_respects_backoff_and_retry_after():
+    policy = RetryPolicy(backoff=0.5, max_backoff=1.0, max_retry_after=10)
+    assert all(0 <= policy.delay(attempt) <= min(1.0, 0.5 * 2 ** attempt) for attempt in range(5))
+    assert policy.delay(0, "3") >= 3
+    assert policy.delay(0, "120") is None
+    assert 0 <= policy.delay(0, "not a date") <= 0.5
+
+
+def test_breaker_state_machine():
+    breaker = CircuitBreaker(failure_threshold=3, recovery_time=0.05)
+    for _ in range(2):
+        breaker.failure("a")
+        breaker.before("a")
+    breaker.failure("a")
+    assert breaker.is_open("a")
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before("a")
+    assert error.value.host == "a"
+    #другие хосты не затронуты
+    breaker.before("b")
+
+    #после recovery_time проходит ровно один пробный запрос, его ошибка снова размыкает цепь
+    time.sleep(0.06)
+    breaker.before("a")
+    with pytest.raises(CircuitOpenError):
+        breaker.before("a")
+    breaker.failure("a")
+    with pytest.raises(CircuitOpenError):
+        breaker.before("a")
+
+    #успешный пробный запрос замыкает цепь и сбрасывает счетчик
+    time.sleep(0.06)
+    breaker.before("a")
+    breaker.success("a")
+    assert not breaker.is_open("a")
+    breaker.failure("a")
+    breaker.before("a")
+
+
+def test_idempotent_request_is_retried(server, make_api, phone):
+    api = make_api(retry=RetryPolicy(attempts=3, backoff=0))
+    server.state.error_rate = 1.0
+    assert api.call(phone, FIND_BY_OFFICE, OFFICE).status_code == 503
+    assert server.state.stats["errors"] == 3
+
+
+def test_post_is_not_retried_after_5xx(server, make_api, phone):
+    api = make_api(retry=RetryPolicy(attempts=3, backoff=0))
+    server.state.error_rate = 1.0
+    assert api.request_with_body(phone, "POST", LOGOUT, {}).status_code == 503
+    assert server.state.stats["errors"] == 1
+
+
+def test_breaker_opens_on_5xx_and_rejects_without_sending(server, make_api, phone):
+    api = make_api(retry=False, breaker=CircuitBreaker(failure_threshold=2, recovery_time=60))
+    server.state.error_rate = 1.0
+    for _ in range(2):
+        assert api.call(phone, FIND_BY_OFFICE, OFFICE).status_code == 503
+    sent = server.state.stats["requests"]
+
+    with pytest.raises(CircuitOpenError):
+        api.call(phone, FIND_BY_OFFICE, OFFICE)
+    assert server.state.stats["requests"] == sent
+
+
+def test_breaker_closes_after_any_non_5xx(server, make_api, phone):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=60)
+    api = make_api(retry=False, breaker=breaker)
+    server.state.error_rate = 1.0
+    api.call(phone, FIND_BY_OFFICE, OFFICE)
+    server.state.error_rate = 0.0
+    assert api.call(phone, FIND_BY_OFFICE, OFFICE).status_code == 200
+    server.state.error_rate = 1.0
+    api.call(phone, FIND_BY_OFFICE, OFFICE)
+    assert not breaker.is_open(DELIVERY)
+
+
+#медленный ответ - не больной хост: read timeout не размыкает цепь
+def test_read_timeout_does_not_open_breaker(server, make_api, phone):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_time=60)
+    api = make_api(retry=False, breaker=breaker, timeout=(5.0, 0.05))
+    server.state.latency = 0.3
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            api.call(phone, FIND_BY_OFFICE, OFFICE)
+    assert not breaker.is_open(DELIVERY)
+
+
+def test_connect_failure_opens_breaker(make_api, phone):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=60)
+    api = make_api(retry=False, breaker=breaker)
+    #порт 1 никто не слушает: соединение не устанавливается
+    route_to_mock(api, "http://127.0.0.1:1")
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            api.call(phone, FIND_BY_OFFICE, OFFICE)
+    assert breaker.is_open(DELIVERY)
+    with pytest.raises(CircuitOpenError):
+        api.call(phone, FIND_BY_OFFICE, OFFICE)
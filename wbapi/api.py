@@ -1,120 +1,320 @@
-import sqlite3
 import time
 import json
 import requests
-from typing import Optional, Dict, Any, Tuple
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Any, Tuple, Iterable, List, Callable
 from datetime import datetime, timedelta
-from wbapi.easyheader import SecurityInterceptor, generate_device_id
+from wbapi.easyheader import SecurityInterceptor, SystemClock, generate_device_id
+from wbapi.endpoints import Endpoint, encode_query, BODY, FORM, MULTIPART, RAW
+from wbapi.cache import ResponseCache, CacheEntry
+from wbapi.store import SessionStore, SQLiteSessionStore
+from wbapi.streaming import MultipartStream, MultipartValue, open_sink
+from wbapi.retry import RetryPolicy, CircuitBreaker
+from wbapi.ratelimit import RateLimiter
+from wbapi.batch import BatchCall, run_batch, iter_batch
+from wbapi.metrics import TimedStore, REQUEST_START, REQUEST_END, RETRY, REFRESH
+from wbapi.models import iter_json_array
+from wbapi.location import PositionBuffer
+from wbapi.export import export_range
 import uuid
-from urllib.parse import urlparse
+import os
+import threading
+import logging
+from functools import lru_cache
+from urllib.parse import urlsplit
+from http.cookiejar import DefaultCookiePolicy
+from urllib3.exceptions import NewConnectionError
+
+
+log = logging.getLogger("wbapi")
+
+
+#сессию нельзя восстановить без SMS-кода: нужен новый вход через start_login/complete_login
+class ReauthRequired(ValueError):
+    def __init__(self, phone: str, message: str = None):
+        super().__init__(message or f"Требуется повторная аутентификация для телефона {phone}")
+        self.phone = phone
+
+
+#первый шаг входа: SMS отправлена, ждем код. token - validation token из ответа login.
+#device - устройство и точка входа, в хранилище они попадут вместе с токенами в complete_login
+class LoginChallenge:
+    __slots__ = ("phone", "device", "token", "code_length", "created_at")
+    
+    def __init__(self, phone: str, device: Dict, token: str, code_length: int):
+        self.phone = phone
+        self.device = device
+        self.token = token
+        self.code_length = code_length
+        self.created_at = time.time()
+    
+    @property
+    def device_uuid(self) -> str:
+        return self.device['device_uuid']
+    
+    def __repr__(self):
+        return f"<LoginChallenge {self.phone}: код из {self.code_length} цифр>"
+
+
+#код с консоли, как раньше делал auth. для воркеров передавайте свой code_provider
+def console_code_provider(challenge: LoginChallenge) -> str:
+    return input(f"Введите {challenge.code_length}-значный код для {challenge.phone}: ")
+
+
+#разбор базового URL кэшируется: клиенты дергают одни и те же эндпоинты
+@lru_cache(maxsize=1024)
+def _split_url(url: str) -> Tuple[str, str, str, str]:
+    parsed = urlsplit(url)
+    return f"{parsed.scheme}://{parsed.netloc}{parsed.path}", parsed.netloc, parsed.path, parsed.query
+
+
+#url + query_params => (url для отправки, хост, путь с query для подписи).
+#query кодируется один раз и тем же байтом уходит и в подпись, и в сеть,
+#поэтому подписанный путь всегда совпадает с реально отправленным.
+#None-значения выкидываются, как это делает requests
+def _prepare_target(url: str, query_params: Optional[Dict] = None) -> Tuple[str, str, str]:
+    base, host, path, query = _split_url(url)
+    encoded = encode_query(query_params)
+    if encoded:
+        query = f"{query}&{encoded}" if query else encoded
+    
+    if query:
+        return f"{base}?{query}", host, f"{path}?{query}"
+    return base, host, path
+
 
 class WBCourierAPI:
-    def __init__(self, db_path: str = "wb_courier.db"):
+    #вид тела эндпоинта => аргумент HTTP-клиента
+    _BODY_ARGS = {BODY: "json", FORM: "data", RAW: "data", MULTIPART: "files"}
+    
+    #pool_connections: сколько хостов держим в пуле (r-point, courier-delivery-api, courier.wb.ru, ...)
+    #pool_maxsize: сколько keep-alive соединений держим на один хост
+    #timeout: (connect, read) в секундах, прокидывается в каждый запрос
+    #clock: источник X-TIMESTAMP. ServerClock() подстраивается под время сервера по заголовку Date
+    #response_cache: TTL-кэш справочных GET-ответов, по умолчанию выключен (см. enable_response_cache)
+    #store: где хранить сессии, по умолчанию SQLiteSessionStore(db_path)
+    #retry: повторы после сетевых ошибок, 429 и 5xx, по умолчанию RetryPolicy(). False - без повторов
+    #breaker: размыкатель по хостам (CircuitBreaker), по умолчанию выключен
+    #limiter: ограничение частоты запросов по хосту и телефону (RateLimiter), по умолчанию без ограничений
+    #code_provider: откуда auth берет SMS-код, функция(LoginChallenge) => код. по умолчанию ввод с консоли
+    #coordinates_flush_interval: как часто update_coordinates сбрасывает точки в хранилище, 0 - сразу.
+    #с отложенной записью вызывайте close(): несброшенные точки иначе допишутся только при выходе из процесса
+    def __init__(self, db_path: str = "wb_courier.db", pool_connections: int = 10,
+                 pool_maxsize: int = 10, timeout: Tuple[float, float] = (5.0, 30.0),
+                 clock: Optional[SystemClock] = None, response_cache: Optional[ResponseCache] = None,
+                 store: Optional[SessionStore] = None, retry: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, limiter: Optional[RateLimiter] = None,
+                 code_provider: Optional[Callable[[LoginChallenge], str]] = None,
+                 coordinates_flush_interval: float = 0.0):
         self.db_path = db_path
-        self._init_database()
-        
-    def _init_database(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    phone TEXT PRIMARY KEY,
-                    device_uuid TEXT,
-                    device_name TEXT,
-                    latitude REAL,
-                    longitude REAL,
-                    access_token TEXT,
-                    refresh_token TEXT,
-                    access_expires_at INTEGER,
-                    refresh_expires_at INTEGER,
-                    created_at INTEGER,
-                    updated_at INTEGER
-                )
-            ''')
-            conn.commit()
-    
-    def _get_user(self, phone: str) -> Optional[Dict]:
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE phone = ?', (phone,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
+        self.code_provider = code_provider if code_provider is not None else console_code_provider
+        self.retry = (retry if retry is not None else RetryPolicy()) or None
+        self.breaker = breaker
+        self.limiter = limiter
+        self.pool_maxsize = pool_maxsize
+        self.store = store if store is not None else SQLiteSessionStore(db_path)
+        self.timeout = timeout
+        self.clock = clock if clock is not None else SystemClock()
+        self.response_cache = response_cache
+        self.session = self._create_session(pool_connections, pool_maxsize)
+        #write-through кэш строк users по телефону. словари в кэше не мутируются,
+        #при записи кладется новый словарь, поэтому отдавать их наружу без копии безопасно
+        self._users: Dict[str, Dict] = {}
+        #координаты живут в памяти и пишутся в хранилище с задержкой (write-behind)
+        self._positions = PositionBuffer(self._write_user, coordinates_flush_interval)
+        #single-flight refresh: локи по телефону внутри процесса + аренда в SQLite между процессами
+        self._refresh_locks: Dict[str, threading.Lock] = {}
+        self._refresh_locks_guard = threading.Lock()
+        self.refresh_lease_ttl = 60.0
+        self._renewer = None
+        self._interceptors: Dict[Tuple[str, str], SecurityInterceptor] = {}
+        #подписчики событий (см. add_hook). пока список пуст, события не собираются
+        self._hooks: List = []
+    
+    def _create_session(self, pool_connections: int, pool_maxsize: int) -> requests.Session:
+        #одна сессия на весь клиент: urllib3 держит отдельный пул на каждый хост,
+        #соединения переиспользуются между телефонами, TLS-рукопожатие делается один раз
+        session = requests.Session()
+        #сессия общая для всех телефонов, поэтому куки не копим - иначе они утекут между аккаунтами
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, url, **kwargs)
+        self.clock.observe(response.headers.get("Date"))
+        return response
+    
+    #включить кэш справочников. persist=True - хранить его в той же базе, что и users
+    def enable_response_cache(self, ttls: Optional[Dict] = None, max_entries: int = 512,
+                              persist: bool = False) -> ResponseCache:
+        self.response_cache = ResponseCache(ttls, max_entries, self.db_path if persist else None)
+        return self.response_cache
+    
+    #(ключ, ttl, запись) для кэшируемого запроса или None
+    def _cache_lookup(self, phone: str, method: str, host: str, target: str) -> Optional[Tuple]:
+        if self.response_cache is None:
+            return None
+        matched = self.response_cache.match(phone, method, host, target)
+        if matched is None:
+            return None
+        ttl, key = matched
+        return key, ttl, self.response_cache.get(key)
+    
+    def _cache_store(self, slot: Tuple, response, full_url: str):
+        key, ttl, entry = slot
+        if response.status_code == 304 and entry is not None:
+            return self._cached_response(self.response_cache.refresh(key, ttl, entry), full_url)
+        if response.status_code == 200:
+            self.response_cache.put(key, ttl, response)
+        return response
+    
+    def _cached_response(self, entry: CacheEntry, full_url: str) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry.status
+        response.headers.update(entry.headers)
+        response._content = entry.body
+        response.url = full_url
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+    
+    def close(self):
+        self.stop_token_renewer()
+        self._positions.stop()
+        self.session.close()
+        self.store.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        
+    #fresh=True - игнорировать кэш и перечитать строку из базы (например, ее мог обновить другой процесс)
+    def _get_user(self, phone: str, fresh: bool = False) -> Optional[Dict]:
+        if not fresh:
+            user = self._users.get(phone)
+            if user is not None:
+                return user
+        
+        user = self.store.get_user(phone)
+        if user is None:
+            self._users.pop(phone, None)
+            return None
+        
+        self._users[phone] = user
+        return user
+    
+    #сбросить кэш одного телефона или целиком, если базу меняет кто-то еще
+    def invalidate_cache(self, phone: Optional[str] = None):
+        if phone is None:
+            self._users.clear()
+        else:
+            self._users.pop(phone, None)
     
     def _update_user(self, phone: str, data: Dict):
+        #координаты пишутся напрямую (start_login) - отложенная точка устарела и не должна их перетереть
+        if 'latitude' in data or 'longitude' in data:
+            self._positions.discard(phone)
+        self._write_user(phone, data)
+    
+    #запись строки без оглядки на PositionBuffer, им же и используется при сбросе
+    def _write_user(self, phone: str, data: Dict):
         current_time = int(time.time())
         data['updated_at'] = current_time
         
-        placeholders = ', '.join([f"{key}=?" for key in data.keys()])
-        values = list(data.values()) + [phone]
+        self.store.update_user(phone, data)
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f'''
-                UPDATE users SET {placeholders} WHERE phone = ?
-            ''', values)
-            conn.commit()
+        cached = self._users.get(phone)
+        if cached is not None:
+            self._users[phone] = {**cached, **data}
     
     def _create_user(self, phone: str, device_uuid: str, device_name: str, 
                     latitude: float, longitude: float):
         current_time = int(time.time())
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO users (
-                    phone, device_uuid, device_name, latitude, longitude,
-                    access_token, refresh_token, access_expires_at,
-                    refresh_expires_at, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                phone, device_uuid, device_name, latitude, longitude,
-                None, None, None, None, current_time, current_time
-            ))
-            conn.commit()
+        user = {
+            'phone': phone,
+            'device_uuid': device_uuid,
+            'device_name': device_name,
+            'latitude': float(latitude),
+            'longitude': float(longitude),
+            'access_token': None,
+            'refresh_token': None,
+            'access_expires_at': None,
+            'refresh_expires_at': None,
+            'created_at': current_time,
+            'updated_at': current_time
+        }
+        self._positions.discard(phone)
+        self.store.create_user(user)
+        self._users[phone] = user
     
     def _get_headers(self, phone: str, url: str, is_auth: bool = False) -> Dict:
         """Получение заголовков для запроса"""
+        _, host, target = _prepare_target(url)
+        return self._signed_headers(phone, host, target, is_auth)
+    
+    #target - путь вместе с query ровно в том виде, в каком он уйдет в сеть
+    def _signed_headers(self, phone: str, host: str, target: str, is_auth: bool = False) -> Dict:
         user = self._get_user(phone)
         if not user:
             raise ValueError(f"Пользователь с телефоном {phone} не найден")
         
-        # Парсим URL для получения хоста и пути
-        parsed_url = urlparse(url)
-        host = parsed_url.netloc
-        path = parsed_url.path
-        if parsed_url.query:
-            path += f"?{parsed_url.query}"
-        
-        # Создаем интерцептор с данными пользователя
-        interceptor = SecurityInterceptor(
-            zapp_version="4.91.2",
-            zsignature_version="6f8f8ea7-0773-4cde-a70e",
-            zdevice_id=user['device_uuid'],
-            zdevice_name=user['device_name']
-        )
+        # Для не-auth запросов добавляем Authorization
+        access_token = None if is_auth else self._get_valid_access_token(phone)
+        return self._build_headers(user, host, target, access_token)
+    
+    #подпись запросов входа устройством из start_login, а не сохраненным: старая сессия еще жива
+    def _login_headers(self, phone: str, device: Dict, url: str) -> Dict:
+        _, host, target = _prepare_target(url)
+        return self._build_headers({'phone': phone, **device}, host, target)
+    
+    #интерцепторы кэшируются по устройству: статичные заголовки и HMAC-ключ считаются один раз
+    def _get_interceptor(self, device_uuid: str, device_name: str) -> SecurityInterceptor:
+        key = (device_uuid, device_name)
+        interceptor = self._interceptors.get(key)
+        if interceptor is None:
+            interceptor = SecurityInterceptor(
+                zapp_version="4.91.2",
+                zsignature_version="6f8f8ea7-0773-4cde-a70e",
+                zdevice_id=device_uuid,
+                zdevice_name=device_name,
+                clock=self.clock
+            )
+            self._interceptors[key] = interceptor
+        return interceptor
+    
+    #сборка заголовков без обращения к базе и сети, общая для sync и async клиента
+    #access_token=None - запрос авторизации (login/validate/refresh), без Authorization
+    def _build_headers(self, user: Dict, host: str, target: str, access_token: Optional[str] = None) -> Dict:
+        # Берем интерцептор устройства пользователя из кэша
+        interceptor = self._get_interceptor(user['device_uuid'], user['device_name'])
+        
+        #свежая точка из update_coordinates могла еще не дойти до хранилища
+        position = self._positions.get(user['phone'])
+        latitude, longitude = position if position is not None else (user['latitude'], user['longitude'])
         
         # Генерируем базовые заголовки
         headers = interceptor.generate_headers(
             website_host=host,  # Используем хост из URL
-            path=path,          # Используем путь из URL
-            latitude=user['latitude'],
-            longitude=user['longitude'],
+            path=target,        # Путь с query, как он уйдет в сеть
+            latitude=latitude,
+            longitude=longitude,
             #timestamp=1768821676
         )
         
         # Добавляем Accept header для всех запросов
         headers["Accept"] = "application/json, text/plain"
+        headers["Content-Type"] = "application/json; charset=UTF-8"
         
-        # Для auth запросов добавляем Content-Type
-        if is_auth:
-            headers["Content-Type"] = "application/json; charset=UTF-8"
-        
-        # Для не-auth запросов добавляем Authorization
-        if not is_auth:
-            access_token = self._get_valid_access_token(phone)
+        if access_token is not None:
             headers["Authorization"] = f"Bearer {access_token}"
-            headers["Content-Type"] = "application/json; charset=UTF-8"
         
         return headers
 
@@ -122,27 +322,144 @@ class WBCourierAPI:
     def _get_valid_access_token(self, phone: str) -> str:
         user = self._get_user(phone)
         if not user or not user['access_token']:
-            raise ValueError("Пользователь не аутентифицирован")
+            raise ReauthRequired(phone, "Пользователь не аутентифицирован")
         
         current_time = int(time.time())
         
         #expire..
         if current_time >= user['access_expires_at']:
-            print("Access токен истек, обновляем...")
+            log.info("Access токен истек, обновляем...")
             self._refresh_token(phone)
             user = self._get_user(phone)
         
         return user['access_token']
     
-    def _refresh_token(self, phone: str):
-        user = self._get_user(phone)
+    #телефоны, у которых access токен истекает в ближайшие margin секунд, а refresh еще жив.
+    #читаем из хранилища, а не из кэша: токены могли обновить другие процессы
+    def _sessions_to_renew(self, margin: int) -> list:
+        current_time = int(time.time())
+        return self.store.sessions_to_renew(current_time + margin, current_time)
+    
+    #фоновое обновление токенов за margin секунд до access_expires_at,
+    #чтобы обычные запросы не ждали _refresh_token
+    def start_token_renewer(self, margin: int = 300, interval: float = 30.0):
+        from wbapi.renewer import TokenRenewer
+        
+        self.stop_token_renewer()
+        self._renewer = TokenRenewer(self, margin=margin, interval=interval)
+        self._renewer.start()
+        return self._renewer
+    
+    def stop_token_renewer(self):
+        if self._renewer is not None:
+            self._renewer.stop()
+            self._renewer = None
+    
+    #подписка на события клиента: hook(event, data), список событий - в wbapi.metrics.
+    #ex: collector = MetricsCollector(); api.add_hook(collector); collector.export()
+    def add_hook(self, hook):
+        if not self._hooks and not isinstance(self.store, TimedStore):
+            self.store = TimedStore(self.store, self._emit)
+        self._hooks.append(hook)
+    
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+        if not self._hooks and isinstance(self.store, TimedStore):
+            self.store = self.store.store
+    
+    def _emit(self, event: str, data: Dict):
+        for hook in self._hooks:
+            try:
+                hook(event, data)
+            except Exception:
+                log.exception("Ошибка обработчика события %s", event)
+    
+    #событие request_end для попытки, начатой в started (perf_counter)
+    @staticmethod
+    def _request_event(host: str, endpoint: str, method: str, attempt: int, started: float,
+                       response=None, error: Optional[Exception] = None, stream: bool = False) -> Dict:
+        data = {
+            "host": host, "endpoint": endpoint, "method": method, "attempt": attempt,
+            "status": None, "error": None, "duration": time.perf_counter() - started,
+            "bytes_sent": None, "bytes_received": None
+        }
+        if error is not None:
+            data["error"] = error.__class__.__name__
+            return data
+        
+        data["status"] = response.status_code
+        sent = response.request.headers.get("Content-Length")
+        data["bytes_sent"] = int(sent) if sent else 0
+        received = response.headers.get("Content-Length")
+        if received:
+            data["bytes_received"] = int(received)
+        elif not stream:
+            data["bytes_received"] = len(response.content)
+        return data
+    
+    def _get_refresh_lock(self, phone: str) -> threading.Lock:
+        with self._refresh_locks_guard:
+            lock = self._refresh_locks.get(phone)
+            if lock is None:
+                lock = self._refresh_locks[phone] = threading.Lock()
+            return lock
+    
+    #аренда на обновление токена в хранилище: у SQLite видна всем процессам с тем же db_path.
+    #если владелец упал, аренда протухает через refresh_lease_ttl секунд
+    def _acquire_refresh_lease(self, phone: str, owner: str) -> bool:
+        return self.store.acquire_refresh_lease(phone, owner, self.refresh_lease_ttl)
+    
+    def _release_refresh_lease(self, phone: str, owner: str):
+        self.store.release_refresh_lease(phone, owner)
+    
+    #токен уже обновил кто-то другой: он проживет еще min_ttl секунд и это не тот, который отверг сервер
+    @staticmethod
+    def _token_is_fresh(user: Optional[Dict], rejected_token: Optional[str], min_ttl: int = 0) -> bool:
+        return bool(
+            user and user['access_token']
+            and user['access_token'] != rejected_token
+            and int(time.time()) + min_ttl < user['access_expires_at']
+        )
+    
+    @staticmethod
+    def _lease_owner() -> str:
+        return f"{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex}"
+    
+    #rejected_token - access токен, на который сервер ответил 401. если в базе уже другой
+    #живой токен, значит его обновил параллельный запрос и второй refresh не нужен
+    #min_ttl - обновить заранее, если токену осталось жить меньше min_ttl секунд
+    def _refresh_token(self, phone: str, rejected_token: Optional[str] = None, min_ttl: int = 0):
+        with self._get_refresh_lock(phone):
+            owner = self._lease_owner()
+            while not self._acquire_refresh_lease(phone, owner):
+                #refresh делает другой процесс, ждем его результат
+                time.sleep(0.1)
+                if self._token_is_fresh(self._get_user(phone, fresh=True), rejected_token, min_ttl):
+                    return
+            
+            started = time.perf_counter()
+            ok = False
+            try:
+                ok = self._refresh_token_locked(phone, rejected_token, min_ttl)
+            finally:
+                self._release_refresh_lease(phone, owner)
+                if self._hooks and ok is not None:
+                    self._emit(REFRESH, {"phone": phone, "ok": ok, "duration": time.perf_counter() - started})
+    
+    #=> True после обновления, None если токен уже обновил кто-то другой
+    def _refresh_token_locked(self, phone: str, rejected_token: Optional[str], min_ttl: int = 0):
+        #refresh токен ротируется сервером, берем самый свежий из базы, а не из кэша
+        user = self._get_user(phone, fresh=True)
+        if self._token_is_fresh(user, rejected_token, min_ttl):
+            return None
+        
         if not user or not user['refresh_token']:
-            raise ValueError("Refresh токен не найден")
+            raise ReauthRequired(phone, "Refresh токен не найден")
         
         current_time = int(time.time())
         
         if current_time >= user['refresh_expires_at']:
-            raise ValueError("Refresh токен истек, требуется повторная аутентификация")
+            raise ReauthRequired(phone, "Refresh токен истек, требуется повторная аутентификация")
         
         url = "https://r-point.wb.ru/wbc/api/v1/courier/refresh"
         
@@ -152,62 +469,55 @@ class WBCourierAPI:
             "token": user['refresh_token']
         }
         
-        response = requests.post(url, headers=headers, json=data)
+        response = self._send('POST', url, headers=headers, json=data)
         
         if response.status_code == 200:
-            response_data = response.json()
-            
-            current_time = int(time.time())
-            access_expires = current_time + response_data['access']['ttl']
-            refresh_expires = current_time + response_data['refresh']['ttl']
-            
-            self._update_user(phone, {
-                'access_token': response_data['access']['token'],
-                'refresh_token': response_data['refresh']['token'],
-                'access_expires_at': access_expires,
-                'refresh_expires_at': refresh_expires
-            })
-            print("Токены успешно обновлены")
+            self._update_user(phone, self._tokens_from_response(response.json()))
+            log.info("Токены успешно обновлены")
+            return True
+        elif response.status_code in (400, 401, 403):
+            #refresh токен отозван сервером - без нового входа не обойтись
+            raise ReauthRequired(phone, f"Refresh токен отклонен: {response.status_code} - {response.text}")
         else:
             raise ValueError(f"Ошибка обновления токена: {response.status_code} - {response.text}")
     
-    def auth(self, phone: str, device_uuid: Optional[str] = None, 
-             device_name: Optional[str] = None, 
-             latitude: float = 59.772022, longitude: float = 39.576505):
+    #ответ courier/validate и courier/refresh => поля для users
+    @staticmethod
+    def _tokens_from_response(response_data: Dict) -> Dict:
+        current_time = int(time.time())
+        return {
+            'access_token': response_data['access']['token'],
+            'refresh_token': response_data['refresh']['token'],
+            'access_expires_at': current_time + response_data['access']['ttl'],
+            'refresh_expires_at': current_time + response_data['refresh']['ttl']
+        }
+    
+    #вход в два шага без блокировки потока: start_login отправляет SMS и возвращает LoginChallenge,
+    #complete_login(challenge, code) проверяет код и сохраняет токены. код можно получить где угодно
+    #(бот, очередь, веб-форма) и завершить вход хоть из другого потока
+    def start_login(self, phone: str, device_uuid: Optional[str] = None, device_name: Optional[str] = None,
+                    latitude: float = 59.772022, longitude: float = 39.576505) -> LoginChallenge:
         existing_user = self._get_user(phone)
         
-        if existing_user and existing_user['access_token']:
-            current_time = int(time.time())
-            if current_time < existing_user['access_expires_at']:
-                print("Пользователь уже аутентифицирован")
-                return
-            elif current_time < existing_user['refresh_expires_at']:
-                print("Access токен истек, обновляем...")
-                self._refresh_token(phone)
-                return
-        
         if device_uuid is None:
-            device_uuid = generate_device_id()
+            device_uuid = existing_user['device_uuid'] if existing_user and existing_user['device_uuid'] else generate_device_id()
         
         if device_name is None:
-            device_name = "huawei p30 pro"
+            device_name = existing_user['device_name'] if existing_user and existing_user['device_name'] else "huawei p30 pro"
         
-        if existing_user:
-            self._update_user(phone, {
-                'device_uuid': device_uuid,
-                'device_name': device_name,
-                'latitude': latitude,
-                'longitude': longitude,
-                'access_token': None,
-                'refresh_token': None,
-                'access_expires_at': None,
-                'refresh_expires_at': None
-            })
-        else:
+        device = {
+            'device_uuid': device_uuid,
+            'device_name': device_name,
+            'latitude': float(latitude),
+            'longitude': float(longitude)
+        }
+        
+        #у существующего пользователя ничего не меняем: без принятого кода его сессия должна работать дальше
+        if not existing_user:
             self._create_user(phone, device_uuid, device_name, latitude, longitude)
         
         url = "https://r-point.wb.ru/wbc/api/v1/login"
-        headers = self._get_headers(phone, url, is_auth=True)
+        headers = self._login_headers(phone, device, url)
         
         data = {
             "device_type": "DEVICE_ANDROID",
@@ -216,112 +526,325 @@ class WBCourierAPI:
             "phone": phone
         }
         
-        print(f"Отправляем запрос на отправку кода для телефона {phone}...")
-        response = requests.post(url, headers=headers, json=data)
+        log.info("Отправляем запрос на отправку кода для телефона %s...", phone)
+        response = self._send('POST', url, headers=headers, json=data)
         
-        if response.status_code == 200:
-            response_data = response.json()
-            validation_token = response_data['data']
-            code_length = response_data['code_length']
-            
-            print(f"Код отправлен. Длина кода: {code_length}")
-            
-            code = input(f"Введите {code_length}-значный код: ").strip()
-            
-            if len(code) != code_length:
-                raise ValueError(f"Код должен содержать {code_length} цифр")
-            
-            url = "https://r-point.wb.ru/wbc/api/v1/courier/validate"
-            headers = self._get_headers(phone, url, is_auth=True)
-            
-            data = {
-                "code": code,
-                "device_type": "DEVICE_ANDROID",
-                "device_uuid": device_uuid,
-                "token": validation_token
-            }
-            
-            print("Проверяем код...")
-            response = requests.post(url, headers=headers, json=data)
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                
-                current_time = int(time.time())
-                access_expires = current_time + response_data['access']['ttl']
-                refresh_expires = current_time + response_data['refresh']['ttl']
-                
-                self._update_user(phone, {
-                    'access_token': response_data['access']['token'],
-                    'refresh_token': response_data['refresh']['token'],
-                    'access_expires_at': access_expires,
-                    'refresh_expires_at': refresh_expires
-                })
-                
-                print("Аутентификация успешна! Токены сохранены.")
-                
-            else:
-                raise ValueError(f"Ошибка валидации: {response.status_code} - {response.text}")
-                
-        else:
+        if response.status_code != 200:
             raise ValueError(f"Ошибка отправки кода: {response.status_code} - {response.text}")
-
+        
+        response_data = response.json()
+        challenge = LoginChallenge(phone, device, response_data['data'], response_data['code_length'])
+        log.info("Код отправлен. Длина кода: %s", challenge.code_length)
+        return challenge
     
-    def request_with_query(self, phone: str, method: str, url: str, query_params: Dict = None):
-        self._ensure_auth(phone)
+    #=> (url, тело) запроса courier/validate
+    def _validate_request(self, challenge: LoginChallenge, code: str) -> Tuple[str, Dict]:
+        code = str(code).strip()
+        if len(code) != challenge.code_length:
+            raise ValueError(f"Код должен содержать {challenge.code_length} цифр")
         
-        headers = self._get_headers(phone, url, is_auth=False)
+        data = {
+            "code": code,
+            "device_type": "DEVICE_ANDROID",
+            "device_uuid": challenge.device_uuid,
+            "token": challenge.token
+        }
+        return "https://r-point.wb.ru/wbc/api/v1/courier/validate", data
+    
+    def complete_login(self, challenge: LoginChallenge, code: str):
+        url, data = self._validate_request(challenge, code)
+        headers = self._login_headers(challenge.phone, challenge.device, url)
         
-        if method.upper() == 'GET':
-            response = requests.get(url, headers=headers, params=query_params)
-        elif method.upper() == 'POST':
-            response = requests.post(url, headers=headers, params=query_params)
-        else:
-            raise ValueError(f"Неподдерживаемый метод: {method}")
+        log.info("Проверяем код...")
+        response = self._send('POST', url, headers=headers, json=data)
         
-        if response.status_code == 401:
-            print("Получена 401 ошибка, пытаемся обновить токен...")
-            self._refresh_token(phone)
-            headers = self._get_headers(phone, url, is_auth=False)
-            
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=headers, params=query_params)
-            else:
-                response = requests.post(url, headers=headers, params=query_params)
+        if response.status_code != 200:
+            raise ValueError(f"Ошибка валидации: {response.status_code} - {response.text}")
         
-        return response
+        #код принят: новые устройство и токены заменяют прежнюю сессию разом
+        self._update_user(challenge.phone, {**challenge.device, **self._tokens_from_response(response.json())})
+        log.info("Аутентификация успешна! Токены сохранены.")
     
-    def request_with_body(self, phone: str, method: str, url: str, body: Dict = None):
-        self._ensure_auth(phone)
+    #вход целиком: если сессия жива - ничего не делает, если жив refresh - обновляет токены,
+    #иначе start_login + код от code_provider (по умолчанию self.code_provider, ввод с консоли) + complete_login
+    def auth(self, phone: str, device_uuid: Optional[str] = None, 
+             device_name: Optional[str] = None, 
+             latitude: float = 59.772022, longitude: float = 39.576505,
+             code_provider: Optional[Callable[[LoginChallenge], str]] = None):
+        existing_user = self._get_user(phone)
         
-        headers = self._get_headers(phone, url, is_auth=False)
+        if existing_user and existing_user['access_token']:
+            current_time = int(time.time())
+            if current_time < existing_user['access_expires_at']:
+                log.info("Пользователь уже аутентифицирован")
+                return
+            elif current_time < existing_user['refresh_expires_at']:
+                log.info("Access токен истек, обновляем...")
+                self._refresh_token(phone)
+                return
         
-        if method.upper() == 'GET':
-            response = requests.get(url, headers=headers, json=body)
-        elif method.upper() == 'POST':
-            response = requests.post(url, headers=headers, json=body)
-        else:
+        challenge = self.start_login(phone, device_uuid or generate_device_id(), device_name, latitude, longitude)
+        code = (code_provider or self.code_provider)(challenge)
+        self.complete_login(challenge, code)
+
+    
+    #общий путь для request_with_query/request_with_body: URL и query собираются один раз,
+    #подпись и отправка используют один и тот же target
+    def _request(self, phone: str, method: str, url: str, query_params: Dict = None, **kwargs):
+        method = method.upper()
+        if method not in ('GET', 'POST'):
             raise ValueError(f"Неподдерживаемый метод: {method}")
         
-        if response.status_code == 401:
-            print("Получена 401 ошибка, пытаемся обновить токен...")
-            self._refresh_token(phone)
-            headers = self._get_headers(phone, url, is_auth=False)
+        full_url, host, target = _prepare_target(url, query_params)
+        return self._request_target(phone, method, full_url, host, target, **kwargs)
+    
+    #отправка уже собранного target. authorized=False - эндпоинт без Authorization (только подпись).
+    #headers - дополнительные заголовки поверх подписанных, None в значении убирает заголовок.
+    #template - шаблон пути эндпоинта для событий (по умолчанию путь из target)
+    def _request_target(self, phone: str, method: str, full_url: str, host: str, target: str,
+                        authorized: bool = True, headers: Optional[Dict] = None,
+                        template: Optional[str] = None, retry: bool = True, **kwargs):
+        cache_slot = None if kwargs.get("stream") else self._cache_lookup(phone, method, host, target)
+        if cache_slot is not None and cache_slot[2] is not None:
+            entry = cache_slot[2]
+            if entry.is_fresh():
+                return self._cached_response(entry, full_url)
+            #протухло - спрашиваем сервер, изменилось ли что-нибудь
+            headers = {**entry.validators(), **(headers or {})}
+        
+        if authorized:
+            self._ensure_auth(phone)
+        
+        response, signed = self._send_signed(phone, method, full_url, host, target, headers,
+                                             is_auth=not authorized, template=template, retry=retry, **kwargs)
+        
+        if authorized and response.status_code == 401:
+            log.info("Получена 401 ошибка, пытаемся обновить токен...")
+            #отпускаем соединение обратно в пул, если ответ был потоковым
+            response.close()
+            self._rewind_body(kwargs)
+            self._refresh_token(phone, rejected_token=signed["Authorization"][len("Bearer "):])
+            response, signed = self._send_signed(phone, method, full_url, host, target, headers,
+                                                 template=template, retry=retry, **kwargs)
+        
+        if cache_slot is not None:
+            return self._cache_store(cache_slot, response, full_url)
+        return response
+    
+    #подпись + отправка с повторами по self.retry. каждая попытка подписывается заново (свежий X-TIMESTAMP).
+    #=> (ответ, отправленные заголовки)
+    def _send_signed(self, phone: str, method: str, full_url: str, host: str, target: str,
+                     headers: Optional[Dict], is_auth: bool = False, template: Optional[str] = None,
+                     retry: bool = True, **kwargs):
+        endpoint = template or target.split('?', 1)[0]
+        #retry=False (long-poll): одна попытка и мимо breaker - ошибка сразу уходит вызывающему
+        policy = self.retry if retry else None
+        breaker = self.breaker if retry else None
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before(host)
+            if self.limiter is not None:
+                pause = self.limiter.reserve(host, phone)
+                if pause > 0:
+                    time.sleep(pause)
+            signed = self._merge_headers(self._signed_headers(phone, host, target, is_auth=is_auth), headers)
+            if self._hooks:
+                self._emit(REQUEST_START, {"host": host, "endpoint": endpoint, "method": method, "attempt": attempt})
+            started = time.perf_counter()
+            try:
+                response = self._send(method, full_url, headers=signed, **kwargs)
+            except requests.RequestException as e:
+                if self._hooks:
+                    self._emit(REQUEST_END, self._request_event(host, endpoint, method, attempt, started, error=e))
+                connect_failed = self._connect_failed(e)
+                #read timeout и обрыв уже открытого соединения - медленный или сорвавшийся запрос,
+                #а не больной хост: в breaker идут только ошибки соединения (и 5xx, см. _record_status)
+                if breaker is not None and connect_failed:
+                    breaker.failure(host)
+                if policy is None or not policy.retry_error(method, connect_failed, attempt):
+                    raise
+                pause = policy.delay(attempt)
+                reason = e.__class__.__name__
+                log.warning("%s %s: %s, повтор через %.1f с", method, host, reason, pause)
+            else:
+                if self._hooks:
+                    self._emit(REQUEST_END, self._request_event(host, endpoint, method, attempt, started,
+                                                                response, stream=kwargs.get("stream", False)))
+                if breaker is not None:
+                    self._record_status(host, response.status_code)
+                if policy is None or not policy.retry_status(method, response.status_code, attempt):
+                    return response, signed
+                pause = policy.delay(attempt, response.headers.get("Retry-After"))
+                if pause is None:
+                    return response, signed
+                reason = str(response.status_code)
+                log.warning("%s %s: %s, повтор через %.1f с", method, host, reason, pause)
+                response.close()
             
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=headers, json=body)
+            if self._hooks:
+                self._emit(RETRY, {"host": host, "endpoint": endpoint, "method": method, "attempt": attempt,
+                                   "reason": reason, "pause": pause})
+            attempt += 1
+            self._rewind_body(kwargs)
+            time.sleep(pause)
+    
+    #5xx - хост болеет, все остальное (включая 4xx) - хост живой
+    def _record_status(self, host: str, status: int):
+        if self.breaker is not None:
+            if status >= 500:
+                self.breaker.failure(host)
             else:
-                response = requests.post(url, headers=headers, json=body)
+                self.breaker.success(host)
+    
+    #запрос точно не дошел до сервера: не удалось установить соединение
+    @staticmethod
+    def _connect_failed(error: Exception) -> bool:
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+    
+    #потоковое тело (MultipartStream) перед повторной отправкой надо вернуть в начало
+    @staticmethod
+    def _rewind_body(kwargs: Dict):
+        for value in kwargs.values():
+            if hasattr(value, "rewind"):
+                value.rewind()
+    
+    #эндпоинт из реестра или обычный URL => (url, host, target, нужен ли Authorization, шаблон пути)
+    @staticmethod
+    def _resolve_target(endpoint, params: Dict = None,
+                        path_params: Dict = None) -> Tuple[str, str, str, bool, Optional[str]]:
+        if isinstance(endpoint, Endpoint):
+            return (*endpoint.prepare(path_params, params), endpoint.auth, endpoint.path)
+        return (*_prepare_target(endpoint, params), True, None)
+    
+    #скачивание без буферизации всего ответа: куски по chunk_size пишутся в dest
+    #dest - путь, бинарный файл или функция(кусок). возвращает число записанных байт
+    #ex: api.download(phone, MOBILE_API_END_POINT.call_center_file_download, "file.bin", headers={"fileID": file_id})
+    def download(self, phone: str, endpoint, dest, params: Dict = None, path_params: Dict = None,
+                 headers: Dict = None, chunk_size: int = 64 * 1024) -> int:
+        full_url, host, target, authorized, template = self._resolve_target(endpoint, params, path_params)
+        response = self._request_target(phone, "GET", full_url, host, target, authorized=authorized,
+                                        headers=headers, template=template, stream=True)
+        try:
+            if response.status_code != 200:
+                raise ValueError(f"Ошибка скачивания: {response.status_code} - {response.text}")
+            
+            write, close = open_sink(dest)
+            written = 0
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    write(chunk)
+                    written += len(chunk)
+            finally:
+                close()
+            return written
+        finally:
+            response.close()
+    
+    #элементы большого массива из ответа GET по одному, по мере прихода тела, без response.json() целиком.
+    #key - поле с массивом в объекте ответа (None - первый массив), model - класс из wbapi.models.record
+    #ex: for task in api.iter_items(phone, COURIER_DELIVERY_API_END_POINT.find_free_tasks_by_office, {...}, model=Task)
+    def iter_items(self, phone: str, endpoint, params: Dict = None, key: Optional[str] = None,
+                   model: Optional[type] = None, path_params: Dict = None, headers: Dict = None,
+                   chunk_size: int = 64 * 1024):
+        full_url, host, target, authorized, template = self._resolve_target(endpoint, params, path_params)
+        response = self._request_target(phone, "GET", full_url, host, target, authorized=authorized,
+                                        headers=headers, template=template, stream=True)
+        try:
+            if response.status_code != 200:
+                raise ValueError(f"Ошибка запроса: {response.status_code} - {response.text}")
+            yield from iter_json_array(response.iter_content(chunk_size), key, model)
+        finally:
+            response.close()
+    
+    #multipart-загрузка из файлов/байтов/memoryview без сборки тела в памяти
+    #fields: {"file": ("photo.jpg", open("photo.jpg", "rb"), "image/jpeg"), "data": "..."}
+    def upload(self, phone: str, endpoint, fields: Dict[str, MultipartValue], params: Dict = None,
+               path_params: Dict = None, headers: Dict = None, chunk_size: int = 64 * 1024):
+        full_url, host, target, authorized, template = self._resolve_target(endpoint, params, path_params)
+        body = MultipartStream(fields, chunk_size)
+        return self._request_target(phone, "POST", full_url, host, target, authorized=authorized,
+                                    headers={**body.headers(), **(headers or {})}, template=template, data=body)
+    
+    @staticmethod
+    def _merge_headers(signed: Dict, extra: Optional[Dict]) -> Dict:
+        if extra:
+            for key, value in extra.items():
+                if value is None:
+                    signed.pop(key, None)
+                else:
+                    signed[key] = value
+        return signed
+    
+    #аргументы вызова эндпоинта из реестра wbapi.endpoints => (url, host, target, kwargs для отправки)
+    def _endpoint_request(self, endpoint: Endpoint, params: Dict = None, body: Any = None,
+                          path_params: Dict = None, headers: Dict = None) -> Tuple[str, str, str, Dict]:
+        full_url, host, target = endpoint.prepare(path_params, params)
+        kwargs = {"authorized": endpoint.auth, "headers": headers, "template": endpoint.path}
+        
+        if endpoint.kind in self._BODY_ARGS and body is not None:
+            kwargs[self._BODY_ARGS[endpoint.kind]] = body
+            if endpoint.kind != BODY:
+                #form/multipart: Content-Type с boundary выставит HTTP-клиент
+                default_type = "application/octet-stream" if endpoint.kind == RAW else None
+                kwargs["headers"] = {"Content-Type": default_type, **(headers or {})}
+        
+        return full_url, host, target, kwargs
+    
+    #вызов типизированного эндпоинта: api.call(phone, COURIER_DELIVERY_API_END_POINT.find_free_tasks_by_office, {"office": ..., "sm": ""})
+    #params - query, body - тело (json/form/multipart/bytes по виду эндпоинта), path_params - {BIC}, {taskUid}, ...
+    def call(self, phone: str, endpoint: Endpoint, params: Dict = None, body: Any = None,
+             path_params: Dict = None, headers: Dict = None):
+        full_url, host, target, kwargs = self._endpoint_request(endpoint, params, body, path_params, headers)
+        return self._request_target(phone, endpoint.method, full_url, host, target, **kwargs)
+    
+    #подписка на сообщения чата поддержки через long-poll message/get:
+    #for message in api.messages(phone): ...  повторы отсеиваются, message_id двигается сам
+    def messages(self, phone: str, delay: int = 25, message_id: Optional[str] = None,
+                 enter_chat: Optional[str] = None, backoff: tuple = (1.0, 60.0)):
+        from wbapi.messages import MessagePoller
         
-        return response
+        return MessagePoller(self, phone, delay=delay, message_id=message_id, enter_chat=enter_chat, backoff=backoff)
+    
+    #много вызовов call сразу: не больше max_workers одновременно (по умолчанию pool_maxsize, чтобы хватало
+    #keep-alive соединений), лимиты limiter действуют на каждый запрос. => результаты в порядке calls
+    #ex: api.batch([(phone, REG_COMPANY_END_POINT.bank_by_bic, None, None, {"BIC": bic}) for bic in bics])
+    def batch(self, calls: Iterable[BatchCall], max_workers: Optional[int] = None,
+              return_exceptions: bool = False) -> List:
+        return run_batch(self, calls, max_workers or self.pool_maxsize, return_exceptions)
+    
+    #=> итератор (номер вызова, результат) по мере готовности
+    def batch_as_completed(self, calls: Iterable[BatchCall], max_workers: Optional[int] = None,
+                           return_exceptions: bool = False):
+        return iter_batch(self, calls, max_workers or self.pool_maxsize, return_exceptions)
+    
+    #выгрузка истории за период кусками по chunk_days дней параллельно, с докачкой (см. wbapi.export)
+    #sink: путь (.db/.sqlite - таблица SQLite, иначе NDJSON) или ExportSink. => число строк
+    #ex: api.export(phone, REG_COMPANY_END_POINT.motivation_payslip, "2024-01-01", "2024-12-31", "payslip.ndjson")
+    def export(self, phone: str, endpoint: Endpoint, start, end, sink, chunk_days: int = 7,
+               params: Dict = None, key: Optional[str] = None, range_params: Tuple[str, str] = ("from", "to"),
+               date_format: str = "%Y-%m-%d", max_workers: Optional[int] = None, name: Optional[str] = None) -> int:
+        return export_range(self, phone, endpoint, start, end, sink, chunk_days, params, key, range_params,
+                            date_format, max_workers, name)
+    
+    def request_with_query(self, phone: str, method: str, url: str, query_params: Dict = None):
+        return self._request(phone, method, url, query_params)
+    
+    def request_with_body(self, phone: str, method: str, url: str, body: Dict = None):
+        return self._request(phone, method, url, json=body)
 
     
+    #следующий запрос уже подпишется с этой точкой. в базу она попадет сразу, а при
+    #coordinates_flush_interval > 0 - при очередном сбросе или в close()
     def update_coordinates(self, phone: str, latitude: float, longitude: float):
-        self._update_user(phone, {
-            'latitude': latitude,
-            'longitude': longitude
-        })
-        print(f"Координаты обновлены: {latitude}:{longitude}")
+        self._positions.update(phone, latitude, longitude)
+    
+    #записать накопленные координаты прямо сейчас, например перед передачей базы другому процессу
+    def flush_coordinates(self) -> int:
+        return self._positions.flush()
     
     def get_info(self, phone: str) -> Dict:
         user = self._get_user(phone)
@@ -330,12 +853,14 @@ class WBCourierAPI:
         
         current_time = int(time.time())
         
+        position = self._positions.get(phone) or (user['latitude'], user['longitude'])
+        
         info = {
             "phone": user['phone'],
             "device_uuid": user['device_uuid'],
             "device_name": user['device_name'],
-            "latitude": user['latitude'],
-            "longitude": user['longitude'],
+            "latitude": position[0],
+            "longitude": position[1],
             "access_token": user['access_token'],
             "refresh_token": user['refresh_token'],
             "access_expires_in": max(0, user['access_expires_at'] - current_time) if user['access_expires_at'] else None,
@@ -348,12 +873,12 @@ class WBCourierAPI:
     def logout(self, phone: str):
         user = self._get_user(phone)
         if not user or not user['access_token']:
-            print("Пользователь не аутентифицирован")
+            log.warning("Пользователь не аутентифицирован")
             return
         
         current_time = int(time.time())
         if current_time >= user['access_expires_at']:
-            print("Access токен уже истек")
+            log.info("Access токен уже истек")
             self._update_user(phone, {
                 'access_token': None,
                 'refresh_token': None,
@@ -370,13 +895,13 @@ class WBCourierAPI:
         }
         
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self._send('POST', url, headers=headers, json=data)
             if response.status_code == 200:
-                print("Выход выполнен успешно")
+                log.info("Выход выполнен успешно")
             else:
-                print(f"Ошибка выхода: {response.status_code} - {response.text}")
+                log.warning("Ошибка выхода: %s - %s", response.status_code, response.text)
         except Exception as e:
-            print(f"Ошибка при отправке запроса выхода: {e}")
+            log.warning("Ошибка при отправке запроса выхода: %s", e)
         
         self._update_user(phone, {
             'access_token': None,
@@ -385,24 +910,20 @@ class WBCourierAPI:
             'refresh_expires_at': None
         })
     
+    #живой access токен или refresh. если сессию можно восстановить только SMS-кодом - ReauthRequired,
+    #а не auth(): ждать код внутри запроса значит навсегда занять поток воркера
     def _ensure_auth(self, phone: str):
         user = self._get_user(phone)
         
         if not user:
-            raise ValueError(f"Пользователь с телефоном {phone} не найден. Сначала выполните аутентификацию.")
+            raise ReauthRequired(phone, f"Пользователь с телефоном {phone} не найден. Сначала выполните аутентификацию.")
         
         current_time = int(time.time())
         
         if not user['access_token'] or current_time >= user['access_expires_at']:
             if user['refresh_token'] and current_time < user['refresh_expires_at']:
-                print("Access токен истек, обновляем...")
+                log.info("Access токен истек, обновляем...")
                 self._refresh_token(phone)
             else:
-                print("Токены истекли, требуется повторная аутентификация")
-                print(f"Повторная аутентификация для телефона {phone}")
-                device_uuid = user['device_uuid']
-                device_name = user['device_name']
-                latitude = user['latitude']
-                longitude = user['longitude']
-                
-                self.auth(phone, device_uuid, device_name, latitude, longitude)
+                log.warning("Токены истекли, требуется повторная аутентификация для телефона %s", phone)
+                raise ReauthRequired(phone)
@@ -0,0 +1,522 @@
+import asyncio
+import time
+import logging
+from http.cookiejar import DefaultCookiePolicy
+from typing import Optional, Dict, Tuple, Iterable, List, Callable
+from wbapi.api import WBCourierAPI, ReauthRequired, LoginChallenge, _prepare_target
+from wbapi.easyheader import SystemClock, generate_device_id
+from wbapi.endpoints import Endpoint, BODY, FORM, MULTIPART, RAW
+from wbapi.cache import ResponseCache, CacheEntry
+from wbapi.store import SessionStore
+from wbapi.retry import RetryPolicy, CircuitBreaker
+from wbapi.ratelimit import RateLimiter
+from wbapi.batch import BatchCall, arun_batch, aiter_batch
+from wbapi.streaming import MultipartStream, MultipartValue, open_sink
+from wbapi.metrics import REQUEST_START, REQUEST_END, RETRY, REFRESH
+from wbapi.models import aiter_json_array
+from wbapi.export import aexport_range
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+log = logging.getLogger("wbapi")
+
+
+#asyncio-версия WBCourierAPI. подпись, кэш пользователей и схема базы общие с sync клиентом,
+#сеть идет через httpx.AsyncClient, а SQLite (только при промахе кэша и на запись) - в пуле потоков
+class AsyncWBCourierAPI(WBCourierAPI):
+    _BODY_ARGS = {BODY: "json", FORM: "data", RAW: "content", MULTIPART: "files"}
+
+    #max_connections: общий лимит соединений на клиент
+    #max_keepalive_connections: сколько простаивающих keep-alive соединений держим
+    #keepalive_expiry: через сколько секунд простоя закрывать соединение
+    def __init__(self, db_path: str = "wb_courier.db", max_connections: int = 100,
+                 max_keepalive_connections: int = 20, keepalive_expiry: float = 30.0,
+                 timeout: Tuple[float, float] = (5.0, 30.0), clock: Optional[SystemClock] = None,
+                 response_cache: Optional[ResponseCache] = None, store: Optional[SessionStore] = None,
+                 retry: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None,
+                 limiter: Optional[RateLimiter] = None, code_provider: Optional[Callable] = None,
+                 coordinates_flush_interval: float = 0.0):
+        if httpx is None:
+            raise ImportError("Для AsyncWBCourierAPI нужен httpx: pip install httpx")
+
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._async_refresh_locks: Dict[str, asyncio.Lock] = {}
+        super().__init__(db_path, timeout=timeout, clock=clock, response_cache=response_cache, store=store,
+                         retry=retry, breaker=breaker, limiter=limiter, code_provider=code_provider,
+                         coordinates_flush_interval=coordinates_flush_interval)
+
+    def _create_session(self, pool_connections: int, pool_maxsize: int) -> "httpx.AsyncClient":
+        client = httpx.AsyncClient(
+            limits=self._limits,
+            timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0])
+        )
+        client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return client
+
+    #stream=True: тело не читается, ответ надо закрыть через aclose()
+    async def _send(self, method: str, url: str, stream: bool = False, **kwargs) -> "httpx.Response":
+        if stream:
+            request = self.session.build_request(method, url, **kwargs)
+            response = await self.session.send(request, stream=True)
+        else:
+            response = await self.session.request(method, url, **kwargs)
+        self.clock.observe(response.headers.get("Date"))
+        return response
+
+    #вызывать внутри работающего event loop
+    def start_token_renewer(self, margin: int = 300, interval: float = 30.0):
+        from wbapi.renewer import AsyncTokenRenewer
+
+        if self._renewer is not None:
+            self._renewer._task.cancel()
+        self._renewer = AsyncTokenRenewer(self, margin=margin, interval=interval)
+        self._renewer.start()
+        return self._renewer
+
+    async def stop_token_renewer(self):
+        if self._renewer is not None:
+            await self._renewer.stop()
+            self._renewer = None
+
+    #кэш в памяти дергаем напрямую, кэш с SQLite - в пуле потоков
+    async def _run_cache(self, func, *args):
+        if self.response_cache.db_path:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def _cached_response(self, entry: CacheEntry, full_url: str) -> "httpx.Response":
+        return httpx.Response(entry.status, headers=entry.headers, content=entry.body,
+                              request=httpx.Request("GET", full_url))
+
+    async def close(self):
+        await self.stop_token_renewer()
+        await asyncio.to_thread(self._positions.stop)
+        await self.session.aclose()
+        self.store.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+
+    #close() здесь корутина: обычный with закрыл бы клиент, не дождавшись ее
+    def __enter__(self):
+        raise TypeError("AsyncWBCourierAPI открывается через async with")
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _aget_user(self, phone: str, fresh: bool = False) -> Optional[Dict]:
+        if not fresh:
+            user = self._users.get(phone)
+            if user is not None:
+                return user
+        return await asyncio.to_thread(self._get_user, phone, fresh)
+
+    async def _aupdate_user(self, phone: str, data: Dict):
+        await asyncio.to_thread(self._update_user, phone, data)
+
+    async def _clear_tokens(self, phone: str):
+        await self._aupdate_user(phone, {
+            'access_token': None,
+            'refresh_token': None,
+            'access_expires_at': None,
+            'refresh_expires_at': None
+        })
+
+    async def _get_headers(self, phone: str, url: str, is_auth: bool = False) -> Dict:
+        _, host, target = _prepare_target(url)
+        return await self._signed_headers(phone, host, target, is_auth)
+
+    async def _signed_headers(self, phone: str, host: str, target: str, is_auth: bool = False) -> Dict:
+        user = await self._aget_user(phone)
+        if not user:
+            raise ValueError(f"Пользователь с телефоном {phone} не найден")
+
+        access_token = None if is_auth else await self._get_valid_access_token(phone)
+        return self._build_headers(user, host, target, access_token)
+
+    async def _get_valid_access_token(self, phone: str) -> str:
+        user = await self._aget_user(phone)
+        if not user or not user['access_token']:
+            raise ReauthRequired(phone, "Пользователь не аутентифицирован")
+
+        if int(time.time()) >= user['access_expires_at']:
+            log.info("Access токен истек, обновляем...")
+            await self._refresh_token(phone)
+            user = await self._aget_user(phone)
+
+        return user['access_token']
+
+    def _get_async_refresh_lock(self, phone: str) -> asyncio.Lock:
+        lock = self._async_refresh_locks.get(phone)
+        if lock is None:
+            lock = self._async_refresh_locks[phone] = asyncio.Lock()
+        return lock
+
+    #та же схема single-flight, что и в WBCourierAPI._refresh_token: asyncio.Lock на телефон
+    #внутри event loop + аренда в SQLite против других процессов и sync-потоков
+    async def _refresh_token(self, phone: str, rejected_token: Optional[str] = None, min_ttl: int = 0):
+        async with self._get_async_refresh_lock(phone):
+            owner = self._lease_owner()
+            while not await asyncio.to_thread(self._acquire_refresh_lease, phone, owner):
+                await asyncio.sleep(0.1)
+                if self._token_is_fresh(await self._aget_user(phone, fresh=True), rejected_token, min_ttl):
+                    return
+
+            started = time.perf_counter()
+            ok = False
+            try:
+                ok = await self._refresh_token_locked(phone, rejected_token, min_ttl)
+            finally:
+                await asyncio.to_thread(self._release_refresh_lease, phone, owner)
+                if self._hooks and ok is not None:
+                    self._emit(REFRESH, {"phone": phone, "ok": ok, "duration": time.perf_counter() - started})
+
+    async def _refresh_token_locked(self, phone: str, rejected_token: Optional[str], min_ttl: int = 0):
+        user = await self._aget_user(phone, fresh=True)
+        if self._token_is_fresh(user, rejected_token, min_ttl):
+            return None
+
+        if not user or not user['refresh_token']:
+            raise ReauthRequired(phone, "Refresh токен не найден")
+
+        if int(time.time()) >= user['refresh_expires_at']:
+            raise ReauthRequired(phone, "Refresh токен истек, требуется повторная аутентификация")
+
+        url = "https://r-point.wb.ru/wbc/api/v1/courier/refresh"
+        _, host, target = _prepare_target(url)
+        headers = self._build_headers(user, host, target)
+
+        response = await self._send('POST', url, headers=headers, json={"token": user['refresh_token']})
+
+        if response.status_code == 200:
+            await self._aupdate_user(phone, self._tokens_from_response(response.json()))
+            log.info("Токены успешно обновлены")
+            return True
+        elif response.status_code in (400, 401, 403):
+            raise ReauthRequired(phone, f"Refresh токен отклонен: {response.status_code} - {response.text}")
+        else:
+            raise ValueError(f"Ошибка обновления токена: {response.status_code} - {response.text}")
+
+    async def start_login(self, phone: str, device_uuid: Optional[str] = None, device_name: Optional[str] = None,
+                          latitude: float = 59.772022, longitude: float = 39.576505) -> LoginChallenge:
+        existing_user = await self._aget_user(phone)
+
+        if device_uuid is None:
+            device_uuid = existing_user['device_uuid'] if existing_user and existing_user['device_uuid'] else generate_device_id()
+
+        if device_name is None:
+            device_name = existing_user['device_name'] if existing_user and existing_user['device_name'] else "huawei p30 pro"
+
+        device = {
+            'device_uuid': device_uuid,
+            'device_name': device_name,
+            'latitude': float(latitude),
+            'longitude': float(longitude)
+        }
+
+        #у существующего пользователя ничего не меняем: без принятого кода его сессия должна работать дальше
+        if not existing_user:
+            await asyncio.to_thread(self._create_user, phone, device_uuid, device_name, latitude, longitude)
+
+        url = "https://r-point.wb.ru/wbc/api/v1/login"
+        headers = self._login_headers(phone, device, url)
+
+        data = {
+            "device_type": "DEVICE_ANDROID",
+            "device_uuid": device_uuid,
+            "is_admin": False,
+            "phone": phone
+        }
+
+        log.info("Отправляем запрос на отправку кода для телефона %s...", phone)
+        response = await self._send('POST', url, headers=headers, json=data)
+
+        if response.status_code != 200:
+            raise ValueError(f"Ошибка отправки кода: {response.status_code} - {response.text}")
+
+        response_data = response.json()
+        challenge = LoginChallenge(phone, device, response_data['data'], response_data['code_length'])
+        log.info("Код отправлен. Длина кода: %s", challenge.code_length)
+        return challenge
+
+    async def complete_login(self, challenge: LoginChallenge, code: str):
+        url, data = self._validate_request(challenge, code)
+        headers = self._login_headers(challenge.phone, challenge.device, url)
+
+        log.info("Проверяем код...")
+        response = await self._send('POST', url, headers=headers, json=data)
+
+        if response.status_code != 200:
+            raise ValueError(f"Ошибка валидации: {response.status_code} - {response.text}")
+
+        #код принят: новые устройство и токены заменяют прежнюю сессию разом
+        await self._aupdate_user(challenge.phone, {**challenge.device, **self._tokens_from_response(response.json())})
+        log.info("Аутентификация успешна! Токены сохранены.")
+
+    #code_provider может быть и корутинной функцией. обычная (input() по умолчанию) уходит в пул потоков
+    async def auth(self, phone: str, device_uuid: Optional[str] = None,
+                   device_name: Optional[str] = None,
+                   latitude: float = 59.772022, longitude: float = 39.576505,
+                   code_provider: Optional[Callable] = None):
+        existing_user = await self._aget_user(phone)
+
+        if existing_user and existing_user['access_token']:
+            current_time = int(time.time())
+            if current_time < existing_user['access_expires_at']:
+                log.info("Пользователь уже аутентифицирован")
+                return
+            elif current_time < existing_user['refresh_expires_at']:
+                log.info("Access токен истек, обновляем...")
+                await self._refresh_token(phone)
+                return
+
+        challenge = await self.start_login(phone, device_uuid or generate_device_id(), device_name,
+                                           latitude, longitude)
+        provider = code_provider or self.code_provider
+        if asyncio.iscoroutinefunction(provider):
+            code = await provider(challenge)
+        else:
+            code = await asyncio.to_thread(provider, challenge)
+        await self.complete_login(challenge, code)
+
+    async def _request(self, phone: str, method: str, url: str, query_params: Dict = None, **kwargs):
+        method = method.upper()
+        if method not in ('GET', 'POST'):
+            raise ValueError(f"Неподдерживаемый метод: {method}")
+
+        full_url, host, target = _prepare_target(url, query_params)
+        return await self._request_target(phone, method, full_url, host, target, **kwargs)
+
+    async def _request_target(self, phone: str, method: str, full_url: str, host: str, target: str,
+                              authorized: bool = True, headers: Optional[Dict] = None,
+                              template: Optional[str] = None, retry: bool = True, **kwargs):
+        cache_slot = None
+        if self.response_cache is not None and not kwargs.get("stream"):
+            cache_slot = await self._run_cache(self._cache_lookup, phone, method, host, target)
+        if cache_slot is not None and cache_slot[2] is not None:
+            entry = cache_slot[2]
+            if entry.is_fresh():
+                return self._cached_response(entry, full_url)
+            headers = {**entry.validators(), **(headers or {})}
+
+        if authorized:
+            await self._ensure_auth(phone)
+
+        response, signed = await self._send_signed(phone, method, full_url, host, target, headers,
+                                                   is_auth=not authorized, template=template, retry=retry,
+                                                   **kwargs)
+
+        if authorized and response.status_code == 401:
+            log.info("Получена 401 ошибка, пытаемся обновить токен...")
+            await response.aclose()
+            self._rewind_body(kwargs)
+            await self._refresh_token(phone, rejected_token=signed["Authorization"][len("Bearer "):])
+            response, signed = await self._send_signed(phone, method, full_url, host, target, headers,
+                                                       template=template, retry=retry, **kwargs)
+
+        if cache_slot is not None:
+            return await self._run_cache(self._cache_store, cache_slot, response, full_url)
+        return response
+
+    async def _send_signed(self, phone: str, method: str, full_url: str, host: str, target: str,
+                           headers: Optional[Dict], is_auth: bool = False, template: Optional[str] = None,
+                           retry: bool = True, **kwargs):
+        endpoint = template or target.split('?', 1)[0]
+        #retry=False (long-poll): одна попытка и мимо breaker - ошибка сразу уходит вызывающему
+        policy = self.retry if retry else None
+        breaker = self.breaker if retry else None
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before(host)
+            if self.limiter is not None:
+                pause = self.limiter.reserve(host, phone)
+                if pause > 0:
+                    await asyncio.sleep(pause)
+            signed = self._merge_headers(await self._signed_headers(phone, host, target, is_auth=is_auth), headers)
+            if self._hooks:
+                self._emit(REQUEST_START, {"host": host, "endpoint": endpoint, "method": method, "attempt": attempt})
+            started = time.perf_counter()
+            try:
+                response = await self._send(method, full_url, headers=signed, **kwargs)
+            except httpx.TransportError as e:
+                if self._hooks:
+                    self._emit(REQUEST_END, self._request_event(host, endpoint, method, attempt, started, error=e))
+                connect_failed = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                #как в WBCourierAPI._send_signed: ReadTimeout хост больным не делает
+                if breaker is not None and connect_failed:
+                    breaker.failure(host)
+                if policy is None or not policy.retry_error(method, connect_failed, attempt):
+                    raise
+                pause = policy.delay(attempt)
+                reason = e.__class__.__name__
+                log.warning("%s %s: %s, повтор через %.1f с", method, host, reason, pause)
+            else:
+                if self._hooks:
+                    self._emit(REQUEST_END, self._request_event(host, endpoint, method, attempt, started,
+                                                                response, stream=kwargs.get("stream", False)))
+                if breaker is not None:
+                    self._record_status(host, response.status_code)
+                if policy is None or not policy.retry_status(method, response.status_code, attempt):
+                    return response, signed
+                pause = policy.delay(attempt, response.headers.get("Retry-After"))
+                if pause is None:
+                    return response, signed
+                reason = str(response.status_code)
+                log.warning("%s %s: %s, повтор через %.1f с", method, host, reason, pause)
+                await response.aclose()
+
+            if self._hooks:
+                self._emit(RETRY, {"host": host, "endpoint": endpoint, "method": method, "attempt": attempt,
+                                   "reason": reason, "pause": pause})
+            attempt += 1
+            self._rewind_body(kwargs)
+            await asyncio.sleep(pause)
+
+    async def call(self, phone: str, endpoint: Endpoint, params: Dict = None, body=None,
+                   path_params: Dict = None, headers: Dict = None):
+        full_url, host, target, kwargs = self._endpoint_request(endpoint, params, body, path_params, headers)
+        return await self._request_target(phone, endpoint.method, full_url, host, target, **kwargs)
+
+    #dest может быть и корутинной функцией: результат вызова дожидаемся
+    async def download(self, phone: str, endpoint, dest, params: Dict = None, path_params: Dict = None,
+                       headers: Dict = None, chunk_size: int = 64 * 1024) -> int:
+        full_url, host, target, authorized, template = self._resolve_target(endpoint, params, path_params)
+        response = await self._request_target(phone, "GET", full_url, host, target, authorized=authorized,
+                                              headers=headers, template=template, stream=True)
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise ValueError(f"Ошибка скачивания: {response.status_code} - {response.text}")
+
+            write, close = open_sink(dest)
+            written = 0
+            try:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    result = write(chunk)
+                    if asyncio.iscoroutine(result):
+                        await result
+                    written += len(chunk)
+            finally:
+                close()
+            return written
+        finally:
+            await response.aclose()
+
+    #async for task in api.iter_items(phone, endpoint, params, model=Task): ...
+    async def iter_items(self, phone: str, endpoint, params: Dict = None, key: Optional[str] = None,
+                         model: Optional[type] = None, path_params: Dict = None, headers: Dict = None,
+                         chunk_size: int = 64 * 1024):
+        full_url, host, target, authorized, template = self._resolve_target(endpoint, params, path_params)
+        response = await self._request_target(phone, "GET", full_url, host, target, authorized=authorized,
+                                              headers=headers, template=template, stream=True)
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise ValueError(f"Ошибка запроса: {response.status_code} - {response.text}")
+            async for item in aiter_json_array(response.aiter_bytes(chunk_size), key, model):
+                yield item
+        finally:
+            await response.aclose()
+
+    async def upload(self, phone: str, endpoint, fields: Dict[str, MultipartValue], params: Dict = None,
+                     path_params: Dict = None, headers: Dict = None, chunk_size: int = 64 * 1024):
+        full_url, host, target, authorized, template = self._resolve_target(endpoint, params, path_params)
+        body = MultipartStream(fields, chunk_size)
+        return await self._request_target(phone, "POST", full_url, host, target, authorized=authorized,
+                                          headers={**body.headers(), **(headers or {})}, template=template,
+                                          content=body.async_body())
+
+    #по умолчанию не больше max_connections вызовов одновременно
+    async def batch(self, calls: Iterable[BatchCall], max_concurrency: Optional[int] = None,
+                    return_exceptions: bool = False) -> List:
+        return await arun_batch(self, calls, max_concurrency or self._limits.max_connections, return_exceptions)
+
+    #async for index, result in api.batch_as_completed(calls): ...
+    def batch_as_completed(self, calls: Iterable[BatchCall], max_concurrency: Optional[int] = None,
+                           return_exceptions: bool = False):
+        return aiter_batch(self, calls, max_concurrency or self._limits.max_connections, return_exceptions)
+
+    async def export(self, phone: str, endpoint: Endpoint, start, end, sink, chunk_days: int = 7,
+                     params: Dict = None, key: Optional[str] = None, range_params: Tuple[str, str] = ("from", "to"),
+                     date_format: str = "%Y-%m-%d", max_concurrency: Optional[int] = None,
+                     name: Optional[str] = None) -> int:
+        return await aexport_range(self, phone, endpoint, start, end, sink, chunk_days, params, key, range_params,
+                                   date_format, max_concurrency, name)
+
+    #async for message in api.messages(phone): ...
+    def messages(self, phone: str, delay: int = 25, message_id: Optional[str] = None,
+                 enter_chat: Optional[str] = None, backoff: tuple = (1.0, 60.0)):
+        from wbapi.messages import AsyncMessagePoller
+
+        return AsyncMessagePoller(self, phone, delay=delay, message_id=message_id, enter_chat=enter_chat,
+                                  backoff=backoff)
+
+    async def request_with_query(self, phone: str, method: str, url: str, query_params: Dict = None):
+        return await self._request(phone, method, url, query_params)
+
+    async def request_with_body(self, phone: str, method: str, url: str, body: Dict = None):
+        return await self._request(phone, method, url, json=body)
+
+    #event loop не ждет SQLite: отложенную запись делает поток PositionBuffer, немедленную - пул потоков
+    async def update_coordinates(self, phone: str, latitude: float, longitude: float):
+        if self._positions.interval <= 0:
+            await asyncio.to_thread(self._positions.update, phone, latitude, longitude)
+        else:
+            self._positions.update(phone, latitude, longitude)
+
+    async def flush_coordinates(self) -> int:
+        return await asyncio.to_thread(self._positions.flush)
+
+    async def logout(self, phone: str):
+        user = await self._aget_user(phone)
+        if not user or not user['access_token']:
+            log.warning("Пользователь не аутентифицирован")
+            return
+
+        if int(time.time()) >= user['access_expires_at']:
+            log.info("Access токен уже истек")
+            await self._clear_tokens(phone)
+            return
+
+        url = "https://r-point.wb.ru/wbc/api/v1/logout"
+        headers = await self._get_headers(phone, url, is_auth=False)
+
+        try:
+            response = await self._send('POST', url, headers=headers, json={"deviceType": "DEVICE_ANDROID"})
+            if response.status_code == 200:
+                log.info("Выход выполнен успешно")
+            else:
+                log.warning("Ошибка выхода: %s - %s", response.status_code, response.text)
+        except Exception as e:
+            log.warning("Ошибка при отправке запроса выхода: %s", e)
+
+        await self._clear_tokens(phone)
+
+    async def _ensure_auth(self, phone: str):
+        user = await self._aget_user(phone)
+
+        if not user:
+            raise ReauthRequired(phone, f"Пользователь с телефоном {phone} не найден. Сначала выполните аутентификацию.")
+
+        current_time = int(time.time())
+
+        if not user['access_token'] or current_time >= user['access_expires_at']:
+            if user['refresh_token'] and current_time < user['refresh_expires_at']:
+                log.info("Access токен истек, обновляем...")
+                await self._refresh_token(phone)
+            else:
+                log.warning("Токены истекли, требуется повторная аутентификация для телефона %s", phone)
+                raise ReauthRequired(phone)
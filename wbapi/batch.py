@@ -0,0 +1,107 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, List, Union, Tuple, Dict, Any
+
+
+#один вызов пачки: (phone, endpoint, params, body, path_params, headers) - как аргументы api.call,
+#хвост можно опускать; или словарь с именованными аргументами api.call
+BatchCall = Union[Tuple, Dict[str, Any]]
+
+
+def _invoke(func, call: BatchCall):
+    if isinstance(call, dict):
+        return func(**call)
+    return func(*call)
+
+
+#пачка вызовов через пул потоков поверх общей сессии => результаты в порядке вызовов.
+#return_exceptions=True - исключение встает на место результата, иначе первое из них пробрасывается
+def run_batch(api, calls: Iterable[BatchCall], max_workers: int, return_exceptions: bool = False) -> List:
+    calls = list(calls)
+    results = [None] * len(calls)
+    for index, result in iter_batch(api, calls, max_workers, return_exceptions):
+        results[index] = result
+    return results
+
+
+#то же, но (номер вызова, результат) по мере готовности. в работе не больше max_workers вызовов:
+#следующий берется из calls, когда завершается очередной, а отданные результаты больше не держатся,
+#поэтому память не растет с длиной calls (он может быть и генератором).
+#func - что вызывать вместо api.call с теми же аргументами
+def iter_batch(api, calls: Iterable[BatchCall], max_workers: int, return_exceptions: bool = False, func=None):
+    func = func or api.call
+    pending = enumerate(calls)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wb-batch") as executor:
+        running = {}
+
+        def submit():
+            for index, call in pending:
+                running[executor.submit(_invoke, func, call)] = index
+                return
+
+        try:
+            for _ in range(max_workers):
+                submit()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    submit()
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if not return_exceptions:
+                            raise
+                        result = e
+                    yield index, result
+        finally:
+            #вызывающий бросил итерацию или упал вызов - не запускаем то, что еще не начато
+            for future in running:
+                future.cancel()
+
+
+#asyncio: не больше max_concurrency вызовов одновременно
+async def arun_batch(api, calls: Iterable[BatchCall], max_concurrency: int,
+                     return_exceptions: bool = False) -> List:
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def limited(call):
+        async with semaphore:
+            return await _invoke(api.call, call)
+
+    return await asyncio.gather(*(limited(call) for call in calls), return_exceptions=return_exceptions)
+
+
+#задачи создаются по мере освобождения мест, как в iter_batch
+async def aiter_batch(api, calls: Iterable[BatchCall], max_concurrency: int, return_exceptions: bool = False,
+                      func=None):
+    func = func or api.call
+    pending = enumerate(calls)
+    running = set()
+
+    async def run(index, call):
+        try:
+            return index, await _invoke(func, call)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return index, e
+
+    def submit():
+        for index, call in pending:
+            running.add(asyncio.ensure_future(run(index, call)))
+            return
+
+    try:
+        for _ in range(max_concurrency):
+            submit()
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            running.difference_update(done)
+            for task in done:
+                submit()
+            for task in done:
+                yield task.result()
+    finally:
+        for task in running:
+            task.cancel()
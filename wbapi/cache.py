@@ -0,0 +1,179 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+from wbapi.store import ThreadConnections
+
+
+#справочники, которые почти не меняются: шаблон пути => (ttl в секундах, общий ли кэш для всех телефонов).
+#общий кэш только у эндпоинтов без Authorization, ответы остальных кэшируются по телефону
+DEFAULT_TTLS = {
+    "api/v1/cities/search": (24 * 3600, False),
+    "api/v1/calculator/options": (3600, True),
+    "api/v1/agreements": (24 * 3600, True),
+    "api/v1/banks/by-bic/{BIC}": (7 * 24 * 3600, True),
+    "api/v1/courier/office-regions": (24 * 3600, False),
+    "api/v1/npd/cancel-income-reasons": (24 * 3600, False),
+}
+
+#заголовки, которые имеет смысл хранить вместе с телом
+_KEPT_HEADERS = ("Content-Type", "Content-Encoding", "ETag", "Last-Modified", "Date")
+
+
+class CacheEntry:
+    __slots__ = ("status", "headers", "body", "expires_at")
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes, expires_at: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    #заголовки для условного запроса, если сервер прислал ETag/Last-Modified
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if "ETag" in self.headers:
+            headers["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["Last-Modified"]
+        return headers
+
+
+#TTL-кэш ответов GET для справочных эндпоинтов. LRU в памяти на max_entries записей,
+#опционально пишет записи в SQLite (таблица response_cache рядом с users), чтобы кэш переживал рестарт.
+#протухшая запись с ETag/Last-Modified не удаляется, а перепроверяется условным запросом (304)
+class ResponseCache:
+    #ttls: шаблон пути (как в wbapi.endpoints) => (ttl, shared), по умолчанию DEFAULT_TTLS
+    #db_path: куда сохранять кэш, None - только память
+    def __init__(self, ttls: Optional[Dict[str, Tuple[float, bool]]] = None, max_entries: int = 512,
+                 db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        #соединения по потокам, как у SQLiteSessionStore: без connect на каждый get/put
+        self._connections = ThreadConnections(db_path) if db_path else None
+        #сколько записей на диске (сверху: перезапись ключа тоже считается), чистка - только сверх max_entries
+        self._disk_count = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._rules = [(self._compile(template), ttl, shared)
+                       for template, (ttl, shared) in (ttls if ttls is not None else DEFAULT_TTLS).items()]
+        if db_path:
+            self._init_database()
+
+    #шаблон api/v1/banks/by-bic/{BIC} => регулярка по концу пути запроса
+    @staticmethod
+    def _compile(template: str):
+        parts = re.split(r"\{[^}]+\}", template.strip('/'))
+        return re.compile("(?:^|/)" + "[^/]+".join(re.escape(part) for part in parts) + "$")
+
+    def _init_database(self):
+        conn = self._connections.get()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                expires_at REAL
+            )
+        ''')
+        self._disk_count = conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+    #(ttl, ключ) для запроса или None, если эндпоинт не кэшируется
+    def match(self, phone: str, method: str, host: str, target: str) -> Optional[Tuple[float, str]]:
+        if method != 'GET':
+            return None
+
+        path = target.split('?', 1)[0]
+        for pattern, ttl, shared in self._rules:
+            if pattern.search(path):
+                owner = "*" if shared else phone
+                return ttl, f"{owner} {host}{target}"
+        return None
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if not self.db_path:
+            return None
+
+        row = self._connections.get().execute(
+            'SELECT status, headers, body, expires_at FROM response_cache WHERE key = ?', (key,)).fetchone()
+        if not row:
+            return None
+
+        entry = CacheEntry(row[0], json.loads(row[1]), row[2], row[3])
+        self._remember(key, entry)
+        return entry
+
+    #response - ответ requests или httpx (status_code, headers, content)
+    def put(self, key: str, ttl: float, response) -> Optional[CacheEntry]:
+        if "no-store" in response.headers.get("Cache-Control", ""):
+            return None
+
+        headers = {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers}
+        #тело уже распаковано клиентом
+        headers.pop("Content-Encoding", None)
+        entry = CacheEntry(response.status_code, headers, response.content, time.time() + ttl)
+        self._remember(key, entry)
+        self._persist(key, entry)
+        return entry
+
+    #ответ 304: тело прежнее, продлеваем срок
+    def refresh(self, key: str, ttl: float, entry: CacheEntry) -> CacheEntry:
+        entry = CacheEntry(entry.status, entry.headers, entry.body, time.time() + ttl)
+        self._remember(key, entry)
+        self._persist(key, entry)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            self._connections.get().execute('DELETE FROM response_cache')
+            with self._lock:
+                self._disk_count = 0
+
+    def close(self):
+        if self._connections is not None:
+            self._connections.close()
+
+    def _remember(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _persist(self, key: str, entry: CacheEntry):
+        if not self.db_path:
+            return
+        conn = self._connections.get()
+        conn.execute('''
+            INSERT OR REPLACE INTO response_cache (key, status, headers, body, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (key, entry.status, json.dumps(entry.headers), entry.body, entry.expires_at))
+        with self._lock:
+            self._disk_count += 1
+            if self._disk_count <= self.max_entries:
+                return
+            self._disk_count = conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+            if self._disk_count <= self.max_entries:
+                return
+            #на диске держим не больше записей, чем в памяти, выкидываем самые старые
+            conn.execute('''
+                DELETE FROM response_cache WHERE key NOT IN (
+                    SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT ?
+                )
+            ''', (self.max_entries,))
+            self._disk_count = self.max_entries
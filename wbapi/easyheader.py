@@ -4,6 +4,7 @@ import time
 import uuid
 from typing import Dict
 import platform
+from email.utils import parsedate_to_datetime
 
     
 #android random device id
@@ -25,62 +26,121 @@ def version_to_number(version:str) -> int:
     
     return major + minor + patch + build
 
+#источник времени для X-TIMESTAMP. берется в момент подписи, а не при импорте модуля
+class SystemClock:
+    def now(self) -> int:
+        return int(time.time())
+    
+    #date_header - заголовок Date из ответа сервера, обычным часам он не нужен
+    def observe(self, date_header: str):
+        pass
+
+
+#монотонные часы с поправкой на время сервера. не прыгают при переводе системных часов,
+#а смещение относительно сервера учится по заголовкам Date из ответов
+class ServerClock(SystemClock):
+    #smoothing: вес нового замера в скользящем среднем смещения
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self.offset = 0.0
+        self._synced = False
+        self._wall = time.time()
+        self._mono = time.monotonic()
+    
+    def time(self) -> float:
+        return self._wall + (time.monotonic() - self._mono) + self.offset
+    
+    def now(self) -> int:
+        return int(self.time())
+    
+    def observe(self, date_header: str):
+        if not date_header:
+            return
+        try:
+            server_time = parsedate_to_datetime(date_header).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return
+        
+        #Date округлен до секунды вниз, реальное время сервера где-то в [server_time, server_time + 1)
+        sample = server_time + 0.5 - (self._wall + (time.monotonic() - self._mono))
+        if not self._synced:
+            self.offset = sample
+            self._synced = True
+        else:
+            self.offset += self.smoothing * (sample - self.offset)
+
+
+#часы по умолчанию для всех интерцепторов
+SYSTEM_CLOCK = SystemClock()
+
+
 class SecurityInterceptor:
     #zapp-version: хардкор. SecurityInterceptor.smali => buildPayload()
     #zsignature_version - тоже хардкор SecurityInterceptor.smali => X-SIGNATURE-VERSION
     #zdevice_id и zdevice_name генерируются андроедом при каждой новой активации. рекомендую отдельно для каждого аккаунта отдельный айдишник.
     #zhmac_secret - опять хардкор. SecurityInterceptor => hmacSecretBytes_delegate
-    def __init__(self, zapp_version:str, zsignature_version:str, zdevice_id:str="2340cdbf8163ee03", zdevice_name:str="huawei p30 pro", zhmac_secret:str = "18aaaabd-7299-4be8-a943-166a5fe0753f"):
+    #все поля неизменяемые после создания: из них один раз собираются статичные заголовки и HMAC-ключ
+    #clock - откуда брать X-TIMESTAMP, по умолчанию системное время
+    def __init__(self, zapp_version:str, zsignature_version:str, zdevice_id:str="2340cdbf8163ee03", zdevice_name:str="huawei p30 pro", zhmac_secret:str = "18aaaabd-7299-4be8-a943-166a5fe0753f", clock: SystemClock = None):
         self.app_version = zapp_version #test on 4.91.2, константа SecurityInterceptor
         self.signature_version = zsignature_version #"6f8f8ea7-0773-4cde-a70e", константа SecurityInterceptor
         self.hmac_secret = zhmac_secret #константа SecurityInterceptor
         self.device_id = zdevice_id #must generate on every new account
         self.device_name = zdevice_name #must generate on every new account FROM EXISTING DEVICES LIST
+        self.clock = clock if clock is not None else SYSTEM_CLOCK
+        
+        #HMAC с уже загруженным ключом: на каждый запрос только copy() + update()
+        self._hmac = hmac.new(self.hmac_secret.encode('utf-8'), digestmod=hashlib.sha256)
+        
+        #шаблон заголовков. порядок ключей как в приложении, динамические поля
+        #перезаписываются в generate_headers и остаются на своих местах
+        self._headers_template = {
+            "X-COORDINATES": "",
+            "X-APP-VERSION": self.app_version,
+            "X-APP-TYPE":"android", #а кто ещё?
+            "DEVICE-ID":self.device_id,
+            "DEVICE-NAME": self.device_name,
+            "DEBUG":"false",
+            "X-WB-COURIER-VERSION-NAME":self.app_version,
+            "X-WB-COURIER-VERSION-CODE":str(version_to_number(self.app_version)),
+            "X-WB-COURIER-VERSION-ANDROID-ID":self.device_id,
+            "X-WB-COURIER-VERSION-IS-DEBUG":"false",
+            "X-TIMESTAMP": "",
+            "X-SIGNATURE-VERSION": self.signature_version,
+            "X-SIGNATURE": "",
+            "Host": "",
+            "Connection": "Keep-Alive",
+            "Accept-Encoding":"gzip",
+            "User-Agent": "okhttp/4.12.0"
+        }
         
     def _build_payload(self, timestamp: str, path: str) -> bytes:
         payload_string = f"{timestamp}{self.app_version}{path}"
         return payload_string.encode('utf-8')
     
     def _calculate_signature(self, payload: bytes) -> str:
-        key = self.hmac_secret.encode('utf-8')
-        hmac_obj = hmac.new(key, payload, hashlib.sha256)
-        signature_bytes = hmac_obj.digest()
-        
-        return ''.join(f'{b:02x}' for b in signature_bytes)
+        hmac_obj = self._hmac.copy()
+        hmac_obj.update(payload)
+        return hmac_obj.hexdigest()
     
     #website_host: хост (ex: courier-delivery-api.wildberries.ru)
     #path: путь до веба. ex: /api/v1/somepoebota
-    #timestamp: unix time s
+    #timestamp: unix time s, по умолчанию текущее время из self.clock
     #latitude: широта (координата)
     #longitude: долгота (координата)
-    def generate_headers(self, website_host:str, path: str, latitude:float = 60.999999, longitude:float = 40.999999, timestamp: int = int(time.time())) -> Dict[str, str]:
+    def generate_headers(self, website_host:str, path: str, latitude:float = 60.999999, longitude:float = 40.999999, timestamp: int = None) -> Dict[str, str]:
         if timestamp is None:
-            timestamp = int(time.time())
+            timestamp = self.clock.now()
         
         timestamp_str = str(timestamp)
         
         payload = self._build_payload(timestamp_str, path)
-        signature = self._calculate_signature(payload)
         
-        headers = {
-            "X-COORDINATES":f"{latitude}:{longitude}",
-            "X-APP-VERSION": self.app_version,
-            "X-APP-TYPE":"android", #а кто ещё?
-            "DEVICE-ID":self.device_id,
-            "DEVICE-NAME": self.device_name,
-            "DEBUG":"false",
-            "X-WB-COURIER-VERSION-NAME":self.app_version,
-            "X-WB-COURIER-VERSION-CODE":str(version_to_number(self.app_version)),
-            "X-WB-COURIER-VERSION-ANDROID-ID":self.device_id,
-            "X-WB-COURIER-VERSION-IS-DEBUG":"false",
-            "X-TIMESTAMP": timestamp_str,
-            "X-SIGNATURE-VERSION": self.signature_version,
-            "X-SIGNATURE": signature,
-            "Host":website_host,
-            "Connection": "Keep-Alive",
-            "Accept-Encoding":"gzip",
-            "User-Agent": "okhttp/4.12.0"
-        }
+        headers = self._headers_template.copy()
+        headers["X-COORDINATES"] = f"{latitude}:{longitude}"
+        headers["X-TIMESTAMP"] = timestamp_str
+        headers["X-SIGNATURE"] = self._calculate_signature(payload)
+        headers["Host"] = website_host
         
         return headers
 
@@ -0,0 +1,335 @@
+from typing import Optional, Dict, Tuple
+from urllib.parse import urlsplit, urlencode, quote
+from string import Formatter
+
+
+#виды параметров, как они помечены в docs/API.md:
+#query - QUERY (или ???/NONE у GET), body - BODY json, form - FIELD (x-www-form-urlencoded),
+#multipart - MULTIPART, raw - бинарное тело (avatar-upload, Content-Type: image/jpeg)
+QUERY = "query"
+BODY = "body"
+FORM = "form"
+MULTIPART = "multipart"
+RAW = "raw"
+
+
+#кодирование query как у requests: None-значения выкидываются, списки разворачиваются
+def encode_query(query_params: Optional[Dict]) -> str:
+    if not query_params:
+        return ""
+    return urlencode([(k, v) for k, v in query_params.items() if v is not None], doseq=True)
+
+
+class Endpoint:
+    __slots__ = ("name", "base", "method", "path", "kind", "auth",
+                 "_origin", "_host", "_path", "_fields")
+
+    #base: базовый URL группы (ex: https://courier.wb.ru/mobile-api/)
+    #path: путь относительно base, параметры пути в фигурных скобках (ex: api/v1/banks/by-bic/{BIC})
+    #auth: нужен ли Authorization (AUTH- в доке)
+    def __init__(self, name: str, base: str, method: str, path: str, kind: str = QUERY, auth: bool = True):
+        self.name = name
+        self.base = base
+        self.method = method
+        self.path = path
+        self.kind = kind
+        self.auth = auth
+        self._origin = None
+        self._host = None
+        self._path = None
+        self._fields = None
+
+    def __repr__(self):
+        return f"<Endpoint {self.name}: {self.method} {self.base}{self.path}>"
+
+    #разбор base и шаблона пути делается один раз, при первом вызове. эндпоинты общие для всех потоков,
+    #поэтому все считается в локальных переменных, а _path (по нему prepare судит о готовности) ставится последним
+    def _materialize(self):
+        parsed = urlsplit(self.base)
+        #подписывается путь вместе с префиксом группы (/mobile-api/, /wbc/api/v1/, ...)
+        path = parsed.path.rstrip('/') + '/' + self.path
+        self._host = parsed.netloc
+        self._origin = f"{parsed.scheme}://{parsed.netloc}"
+        self._fields = tuple(field for _, field, _, _ in Formatter().parse(path) if field)
+        self._path = path
+
+    #=> (url для отправки, хост, путь с query для подписи)
+    def prepare(self, path_params: Optional[Dict] = None, query_params: Optional[Dict] = None) -> Tuple[str, str, str]:
+        if self._path is None:
+            self._materialize()
+
+        path = self._path
+        if self._fields:
+            if not path_params:
+                raise ValueError(f"{self.name}: не заданы параметры пути {', '.join(self._fields)}")
+            try:
+                path = path.format(**{k: quote(str(v), safe='') for k, v in path_params.items()})
+            except KeyError as e:
+                raise ValueError(f"{self.name}: нет параметра пути {e.args[0]}, "
+                                 f"ожидаются {', '.join(self._fields)}") from None
+
+        query = encode_query(query_params)
+        if query:
+            path = f"{path}?{query}"
+        return self._origin + path, self._host, path
+
+    def url(self, **path_params) -> str:
+        return self.prepare(path_params)[0]
+
+
+#группа эндпоинтов одного END_POINT из приложения. Endpoint создается при первом обращении
+#к атрибуту и дальше лежит в __dict__ группы, повторный доступ - обычный getattr
+class EndpointGroup:
+    #table: имя => (метод, путь, вид параметров, нужен ли Authorization)
+    def __init__(self, name: str, base: str, table: Dict[str, Tuple[str, str, str, bool]]):
+        self._name = name
+        self._base = base
+        self._table = table
+
+    def __getattr__(self, name: str) -> Endpoint:
+        table = self.__dict__.get('_table')
+        if table is None or name not in table:
+            raise AttributeError(f"{self.__dict__.get('_name')} не содержит эндпоинт {name}")
+
+        method, path, kind, auth = table[name]
+        endpoint = Endpoint(f"{self._name}.{name}", self._base, method, path, kind, auth)
+        setattr(self, name, endpoint)
+        return endpoint
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self._table)
+
+    def __dir__(self):
+        return list(self._table)
+
+
+# https://courier.wb.ru/mobile-api/
+MOBILE_API_END_POINT = EndpointGroup("MOBILE_API_END_POINT", "https://courier.wb.ru/mobile-api/", {
+    "cities_search": ("GET", "api/v1/cities/search", QUERY, True),  #country=&query=
+    "acts_list": ("GET", "api/v1/courier/acts/list", QUERY, True),
+    "acts_accept": ("POST", "api/v1/courier/acts/accept", BODY, True),
+    "bonus_get": ("GET", "api/v1/bonus/get", QUERY, True),
+    "education_portal_authorized": ("GET", "api/v1/education/portal-authorized", QUERY, True),
+    "partners_courier_add": ("POST", "api/v2/partners/courier_add", BODY, True),
+    "kisart_courier_status": ("GET", "api/v1/kisart/courier/status", QUERY, True),
+    "courier_profile": ("GET", "api/v1/courier/profile", QUERY, True),
+    "referral": ("GET", "api/v1/referral", QUERY, True),
+    "call_center_file_download": ("GET", "api/v1/call-center/file/download", QUERY, True),  #Header: fileID
+    "call_center_message_get": ("GET", "api/v1/call-center/message/get", QUERY, True),  #lp=&delay=&message_id=&enter_chat=
+    "call_center_file_upload": ("POST", "api/v1/call-center/file/upload", MULTIPART, True),  #Header: RecipientID
+    "call_center_message_send": ("POST", "api/v1/call-center/message/send", BODY, True),
+})
+
+# https://x-courier-api.wildberries.ru/
+REG_COMPANY_END_POINT = EndpointGroup("REG_COMPANY_END_POINT", "https://x-courier-api.wildberries.ru/", {
+    "acts_list": ("GET", "api/v1/courier/acts/list", QUERY, True),
+    "offer_accept": ("POST", "api/v1/courier/offer/accept", BODY, True),
+    "partners_courier_ban": ("POST", "api/v1/partners/courier_ban", BODY, True),
+    "npd_bind": ("POST", "api/v1/npd/bind", BODY, True),
+    "calculator": ("GET", "api/v1/calculator", QUERY, False),  #weight=&metres=&deliveries=&days=&increased=&city=
+    "npd_cancel_income": ("POST", "api/v1/npd/cancel-income", BODY, True),
+    "change_phone_confirm_phone": ("POST", "api/v1/profile/change-phone/confirm-phone", QUERY, True),  #code=
+    "change_phone_confirm_new_phone": ("POST", "api/v1/profile/change-phone/confirm-new-phone", QUERY, True),  #code=&phone=
+    "partners_courier_edit": ("POST", "api/v1/partners/courier_edit", BODY, True),
+    "bank_by_bic": ("GET", "api/v1/banks/by-bic/{BIC}", QUERY, False),
+    "favorite_office_find": ("GET", "api/v1/courier/view/favorite-office/find", QUERY, True),  #search_text=&region_name=
+    "agreements": ("GET", "api/v1/agreements", QUERY, False),  #own_type=
+    "motivation_balance": ("GET", "api/v1/motivation/balance", QUERY, True),
+    "bank_account": ("GET", "api/v1/courier/user-info/bank-account", QUERY, True),  #country=
+    "partners_couriers": ("GET", "api/v1/partners/couriers", QUERY, True),
+    "partners_profile": ("GET", "api/v1/partners/profile", QUERY, True),
+    "profile_reviews": ("GET", "api/v1/profile/reviews", QUERY, True),
+    "admin_courier_reviews": ("GET", "api/v1/admin/courier/reviews", QUERY, True),  #wb_courier_id=
+    "motivation_payslip": ("GET", "api/v2/motivation/payslip", QUERY, True),  #from=&to=
+    "calculator_options": ("GET", "api/v1/calculator/options", QUERY, False),
+    "npd_cancel_income_reasons": ("GET", "api/v1/npd/cancel-income-reasons", QUERY, True),
+    "last_change_user_info": ("GET", "api/v1/courier/user-info/request/last-change-user-info", QUERY, True),
+    "favorite_office": ("GET", "api/v1/courier/user-info/favorite-office", QUERY, True),
+    "npd_account_status": ("GET", "api/v1/npd/account-status", QUERY, True),
+    "office_regions": ("GET", "api/v1/courier/office-regions", QUERY, True),
+    "favorite_office_all": ("GET", "api/v1/courier/view/favorite-office/all", QUERY, True),
+    "register_partner_status": ("GET", "api/v1/register_partner/status", QUERY, True),
+    "user_info": ("GET", "api/v1/courier/user-info", QUERY, True),
+    "change_phone": ("GET", "api/v1/profile/change-phone", QUERY, True),
+    "npd_incomes": ("GET", "api/v1/npd/incomes", QUERY, True),
+    "npd_status": ("GET", "api/v1/npd/status", QUERY, True),
+    "tags_my": ("GET", "api/v1/tags/my", QUERY, True),
+    "default_upgrade_info": ("GET", "api/v1/couriers/default-upgrade-info", QUERY, True),
+    "withdrawal_requests_details": ("GET", "api/v1/motivation/withdrawal-requests/details", QUERY, True),  #tx_id= или from=&to=
+    "favorite_office_add": ("POST", "api/v1/courier/user-info/favorite-office/add", BODY, True),
+    "courier_ping": ("POST", "api/v1/courier/ping", BODY, True),
+    "favorite_office_delete": ("POST", "api/v1/courier/user-info/favorite-office/delete", BODY, True),
+    "change_phone_get_code": ("GET", "api/v1/profile/change-phone/get-code", QUERY, True),
+    "change_phone_set_new_phone": ("POST", "api/v1/profile/change-phone/set-new-phone", QUERY, True),  #phone=
+    "request_withdraw": ("POST", "api/v1/motivation/request-withdraw", QUERY, True),  #amount=
+    "admin_courier_find": ("GET", "api/v1/admin/courier/find", QUERY, True),  #findStr=
+    "favorite_office_search": ("GET", "api/v1/courier/view/favorite-office/search", QUERY, True),  #search_text=
+    "region_search": ("GET", "api/v1/courier/region-search", QUERY, True),  #search_text=
+    "avatar_upload": ("POST", "api/v1/courier/avatar-upload", RAW, True),  #Content-Type: image/jpeg
+    "upload_delivery_photo": ("POST", "api/v1/courier/upload-delivery-photo", MULTIPART, True),
+    "money_transfer_receipt": ("GET", "api/v1/self-employed/money-transfer/{moneyTranId}/receipt", QUERY, True),
+    "change_mobility_type": ("POST", "api/v1/courier/change-mobility-type", BODY, True),
+    "region_set": ("POST", "api/v1/courier/region-set", BODY, True),
+    "offer_terminate": ("POST", "api/v1/courier/offer/terminate", BODY, True),
+    "partners_courier_unban": ("POST", "api/v1/partners/courier_unban", BODY, True),
+    "bank_account_set_v2": ("POST", "api/v2/courier/user-info/bank-account", BODY, True),
+    "user_info_set": ("POST", "api/v1/courier/user-info", BODY, True),
+    "user_info_set_v2": ("POST", "api/v2/courier/user-info", BODY, True),
+    "photo_register_change_type_to_smz": ("POST", "api/v1/photo_register/change-type-to-smz", BODY, True),
+    "photo_register_status": ("GET", "api/v1/photo_register/status", QUERY, True),
+    "photo_register_register": ("POST", "api/v1/photo_register/register", BODY, True),
+    "photo_register_fixed": ("POST", "api/v1/photo_register/fixed", BODY, True),
+    "register_partner_fixed": ("POST", "api/v1/register_partner/fixed", BODY, True),
+    "register_partner_register": ("POST", "api/v1/register_partner/register", BODY, True),
+    "upload_photo": ("POST", "api/v1/{reg_type}/upload_photo", MULTIPART, True),
+    "photo_register_fixed_td": ("POST", "api/v1/photo_register/fixed_td", BODY, True),
+    "photo_register_register_td": ("POST", "api/v2/photo_register/register_td", BODY, True),
+    "notifications_delete": ("POST", "api/v1/notifications/delete", BODY, True),
+    "npd_notifications_archive": ("POST", "api/v1/npd/notifications/archive", BODY, True),
+    "notifications": ("GET", "api/v1/notifications", QUERY, True),
+    "npd_notifications": ("GET", "api/v1/npd/notifications", QUERY, True),  #read=true&archived=false
+    "npd_notifications_count": ("GET", "api/v1/npd/notifications/count", QUERY, True),
+    "notifications_mark_read": ("POST", "api/v1/notifications/mark-read", BODY, True),
+    "npd_notifications_read": ("POST", "api/v1/npd/notifications/read", BODY, True),
+    "set_fcm_token": ("POST", "api/v1/notifications/set-fcm-token", BODY, True),  #{fcm_token:str}
+    "set_hpk_token": ("POST", "api/v1/notifications/set-hpk-token", BODY, True),
+    "esia_register": ("POST", "api/v1/esia/register", BODY, True),
+    "esia_start_customs": ("POST", "api/v1/esia/start_customs", BODY, True),
+    "esia_verify": ("POST", "api/v1/esia/verify", BODY, True),
+    "app_flags": ("GET", "api/v1/couriers/app/flags", QUERY, False),
+    "personal_agreements": ("GET", "api/v1/courier/personal_agreements", QUERY, True),
+    "personal_agreements_accept": ("POST", "api/v1/courier/personal_agreements/accept", BODY, True),
+    "live": ("GET", "api/live", QUERY, False),
+})
+
+# https://r-point.wb.ru/wbc/api/v1/
+AUTH_API_END_POINT = EndpointGroup("AUTH_API_END_POINT", "https://r-point.wb.ru/wbc/api/v1/", {
+    "validate": ("POST", "courier/validate", BODY, False),  #{token, code}
+    "login": ("POST", "login", BODY, False),  #{phone}
+    "refresh": ("POST", "courier/refresh", BODY, False),  #{token}
+    "logout": ("POST", "logout", BODY, True),  #{"deviceType":"DEVICE_ANDROID"}
+})
+
+# https://auth-orr.wildberries.ru/ (старая авторизация)
+OLD_AUTH_API_END_POINT = EndpointGroup("OLD_AUTH_API_END_POINT", "https://auth-orr.wildberries.ru/", {
+    "request_code": ("GET", "request_code", QUERY, True),  #phone=
+    "connect_token": ("POST", "connect/token", FORM, False),  #grant_type, scope, username, password | grant_type, refresh_token
+})
+
+# https://courier-delivery-api.wildberries.ru/
+COURIER_DELIVERY_API_END_POINT = EndpointGroup("COURIER_DELIVERY_API_END_POINT", "https://courier-delivery-api.wildberries.ru/", {
+    "task_assign": ("POST", "api/v1/delivery/task-assign", BODY, True),
+    "postpayment": ("POST", "api/v1/delivery/postpayment", BODY, True),
+    "postponement": ("POST", "api/v1/delivery/postponement", BODY, True),
+    "makecall_to_user": ("POST", "api/v1/dial/makecall-to-user", BODY, True),
+    "geotracking_get_events": ("GET", "api/v1/geotracking/get-events", QUERY, True),  #id=&from=&to=
+    "tasks_get_by_assignee": ("GET", "api/v1/delivery/tasks-get-by-assignee", QUERY, True),  #id=; Header: view
+    "tasks_get_completed": ("GET", "api/v1/delivery/tasks-get-completed", QUERY, True),  #id=&from=&to= | shk=; Header: view
+    "check_postpayment_status": ("GET", "api/v1/delivery/check-postpayment-status/{deliveryUid}", QUERY, True),
+    "check_postpayment_status_v2": ("POST", "api/v2/delivery/check-postpayment-status", BODY, True),
+    "find_free_tasks_by_coords": ("GET", "api/v1/delivery/find-free-tasks-by-coords", QUERY, True),  #lat=&long=&sm=; Header: view=simplify
+    "find_free_tasks_by_coords_v2": ("GET", "api/v2/delivery/find-free-tasks-by-coords", QUERY, True),
+    "user_rate_reasons": ("GET", "api/v1/dict/user-rate-reasons", QUERY, True),
+    "pretension": ("GET", "api/v1/delivery/pretension/{id}", QUERY, True),
+    "defect_type": ("GET", "api/v1/delivery/defect-type", QUERY, True),
+    "appointment_cancellation_reasons": ("GET", "api/v1/dict/appointment-cancellation-reasons", QUERY, True),
+    "task": ("GET", "api/v1/delivery/task/{taskUid}", QUERY, True),
+    "find_free_tasks_by_office": ("GET", "api/v1/delivery/find-free-tasks-by-office", QUERY, True),  #office=&sm=; Header: view
+    "inventory_status_set": ("POST", "api/v1/delivery/inventory-status-set", BODY, True),
+    "rate_user": ("POST", "api/v1/delivery/rate-user", BODY, True),
+    "register": ("POST", "api/v1/delivery/register", BODY, True),
+    "task_cancel_assignment_v2": ("POST", "api/v2/delivery/task-cancel-assignment", MULTIPART, True),
+    "wh_hand_off": ("POST", "api/v1/delivery/wh-hand-off", BODY, True),
+    "geotracking_save_event": ("POST", "api/v1/geotracking/save-event", BODY, True),
+    "fitting": ("POST", "api/v1/delivery/fitting", BODY, True),
+    "wh_tare": ("POST", "api/v1/delivery/wh-tare", BODY, True),
+    "inventory_status_set_v2": ("POST", "api/v2/delivery/inventory-status-set", MULTIPART, True),
+    "set_visit_info": ("POST", "api/v1/delivery/set-visit-info", BODY, True),
+    "task_change_status": ("POST", "api/v1/delivery/task-change-status", BODY, True),
+    "comment_add": ("POST", "api/v1/delivery/comment-add", BODY, True),
+})
+
+# https://heritage.wildberries.ru/
+HERITAGE_API_END_POINT = EndpointGroup("HERITAGE_API_END_POINT", "https://heritage.wildberries.ru/", {
+    "basket_shards": ("GET", "v1/proxy/basket-shards/shardes_v2", QUERY, True),
+})
+
+# https://wbc-metrics.wb.ru/
+ANALYTICS_V2_API_END_POINT = EndpointGroup("ANALYTICS_V2_API_END_POINT", "https://wbc-metrics.wb.ru/", {
+    "events": ("POST", "api/v1/events", BODY, False),
+})
+
+# https://courier.wb.ru/delivery-stats/
+COURIER_STATS_API_END_POINT = EndpointGroup("COURIER_STATS_API_END_POINT", "https://courier.wb.ru/delivery-stats/", {
+    "transactions_couriers": ("GET", "v1/transactions/couriers", QUERY, True),  #date_from=&date_to=&page=&page_size=
+})
+
+# https://courier.wb.ru/rating/
+RATING_END_POINT = EndpointGroup("RATING_END_POINT", "https://courier.wb.ru/rating/", {
+    "rating_courier": ("GET", "v1/rating/courier", QUERY, True),
+})
+
+# https://courier-balance.wildberries.ru/
+BALANCE_API_END_POINT = EndpointGroup("BALANCE_API_END_POINT", "https://courier-balance.wildberries.ru/", {
+    "withdraw": ("POST", "api/v1/balance/withdraw", BODY, True),
+    "balance": ("GET", "api/v1/balance", QUERY, True),
+    "payment_banking_details": ("GET", "api/v1/balance/get-payment-banking-details", QUERY, True),
+    "transactions": ("GET", "api/v1/transactions", QUERY, True),  #date_from=&date_to=&offset=&type=
+    "withdrawable_amount": ("GET", "api/v1/balance/withdrawable-amount", QUERY, True),
+})
+
+# https://point-search.wb.ru/
+HELPER_CHAT_API_END_POINT = EndpointGroup("HELPER_CHAT_API_END_POINT", "https://point-search.wb.ru/", {
+    "send_message": ("POST", "bert-api/delivery/send-message", BODY, True),
+})
+
+# https://courier.wb.ru/stories/
+STORIES_API_END_POINT = EndpointGroup("STORIES_API_END_POINT", "https://courier.wb.ru/stories/", {
+    "stories": ("POST", "v3/stories", BODY, True),
+    "story_action": ("GET", "v2/{story_id}/{slide_id}/{action}", QUERY, True),
+})
+
+# https://courier.wb.ru/tickets/
+TICKETS_API_END_POINT = EndpointGroup("TICKETS_API_END_POINT", "https://courier.wb.ru/tickets/", {
+    "bot_button_click": ("POST", "v1/ticket/bot-button-click", BODY, False),
+    "set_status": ("POST", "v1/ticket/set-status", BODY, True),
+    "create": ("POST", "v2/ticket/create", BODY, True),
+    "create_message": ("POST", "v1/ticket/create-message", BODY, True),
+    "get": ("GET", "v2/ticket/get/{id}", QUERY, True),
+    "categories": ("GET", "v2/tickets/categories", QUERY, True),  #is_allow_work=
+    "available_challenge_reasons": ("GET", "v1/tickets/available-challenge-reasons", QUERY, True),
+    "get_all": ("POST", "v2/ticket/get-all", BODY, True),
+    "upload_files": ("POST", "v1/tickets/uploadfiles", MULTIPART, True),
+})
+
+# https://x-lost-shk.wildberries.ru/
+SHORTAGE_END_POINT = EndpointGroup("SHORTAGE_END_POINT", "https://x-lost-shk.wildberries.ru/", {
+    "losses_get": ("GET", "api/v1/losses/get", QUERY, True),  #subject= | employee=
+    "losses_info": ("GET", "api/v1/losses/info/{id}", QUERY, True),
+    "losses_available_groups": ("GET", "api/v1/losses/available-groups", QUERY, True),
+    "losses_discuss": ("POST", "api/v1/losses/discuss", BODY, True),
+})
+
+# https://courier.wb.ru/autoassignment/
+AUTOASSIGNMENT_API_END_POINT = EndpointGroup("AUTOASSIGNMENT_API_END_POINT", "https://courier.wb.ru/autoassignment/", {
+    "offline": ("POST", "api/v1/offline", BODY, True),  #{fcm_token, lat:null, long:null}
+    "online": ("POST", "api/v1/online", BODY, True),  #{fcm_token, lat, long}
+    "line_status": ("POST", "api/v1/line-status", BODY, True),  #{fcm_token, lat, long}
+    "autoassignment_event": ("POST", "api/v1/autoassignment/event", BODY, True),  #{delay}
+})
+
+# https://chat.wildberries.ru/api/courier-chat-srv/
+CLIENT_CHAT_API_END_POINT = EndpointGroup("CLIENT_CHAT_API_END_POINT", "https://chat.wildberries.ru/api/courier-chat-srv/", {
+    "chats": ("GET", "v1/courier/chats", QUERY, True),
+    "history": ("POST", "v1/courier/history", BODY, True),
+    "events": ("POST", "v1/courier/events", BODY, True),
+    "unread": ("POST", "v1/courier/unread", BODY, True),
+    "send": ("POST", "v1/courier/send", BODY, True),
+    "upload": ("POST", "v1/courier/upload", MULTIPART, True),  #Header: recipientID
+    "validation": ("POST", "v1/courier/validation", BODY, True),
+})
+
+# https://tutwifi.ru/ (не WB)
+WI_FI_POINTS_API_END_POINT = EndpointGroup("WI_FI_POINTS_API_END_POINT", "https://tutwifi.ru/", {
+    "points": ("GET", "api/points", QUERY, False),  #limit=&offset=
+})
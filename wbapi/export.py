@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional, Dict, List, Tuple, Set, Union
+
+from wbapi.batch import iter_batch, aiter_batch
+from wbapi.endpoints import Endpoint, encode_query
+from wbapi.models import loads, JSONArrayParser
+
+log = logging.getLogger("wbapi")
+
+#период выгрузки: (from, to) уже в том виде, в каком уходят в query
+Chunk = Tuple[str, str]
+Day = Union[date, datetime, str]
+
+
+def _as_date(value: Day) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+#[start, end] кусками по chunk_days дней, границы включительно: 01..07, 08..14, ...
+def date_chunks(start: Day, end: Day, chunk_days: int = 7) -> List[Tuple[date, date]]:
+    start, end = _as_date(start), _as_date(end)
+    if chunk_days < 1:
+        raise ValueError("chunk_days должен быть не меньше 1")
+    if end < start:
+        raise ValueError(f"Конец периода {end} раньше начала {start}")
+
+    chunks = []
+    while start <= end:
+        stop = min(end, start + timedelta(days=chunk_days - 1))
+        chunks.append((start, stop))
+        start = stop + timedelta(days=1)
+    return chunks
+
+
+#строки одного периода из тела, которое приходит кусками. массив (корень или поле key, как в find_array)
+#разбирается потоково; тело копится, только пока массив не найден: если его нет совсем
+#(ex: расчетный лист за период - один объект), строкой становится весь ответ
+class _PeriodRows:
+    def __init__(self, key: Optional[str] = None):
+        self.key = key
+        self.parser = JSONArrayParser(key)
+        self.head = []
+        self.rows = []
+        self.no_array = False
+
+    def feed(self, data: bytes):
+        if self.head is not None:
+            self.head.append(data)
+        if not self.no_array:
+            try:
+                self.rows.extend(self.parser.feed(data))
+            except ValueError:
+                self._fallback()
+        if self.head is not None and self.parser.in_array:
+            self.head = None
+
+    def close(self) -> List:
+        if not self.no_array:
+            try:
+                self.rows.extend(self.parser.close())
+                return self.rows
+            except ValueError:
+                self._fallback()
+        body = b"".join(self.head)
+        if not body.strip():
+            return []
+        payload = loads(body)
+        return [payload] if payload else []
+
+    def _fallback(self):
+        #массив уже шел или искали конкретное поле - это ошибка, а не ответ без списка
+        if self.head is None or self.key is not None:
+            raise
+        self.no_array = True
+
+
+def _fetch_rows(api, phone: str, endpoint: Endpoint, params: Dict, key: Optional[str],
+                chunk_size: int = 64 * 1024) -> List:
+    full_url, host, target, authorized, template = api._resolve_target(endpoint, params, None)
+    response = api._request_target(phone, endpoint.method, full_url, host, target, authorized=authorized,
+                                   template=template, stream=True)
+    try:
+        if response.status_code != 200:
+            raise ValueError(f"Ошибка выгрузки: {response.status_code} - {response.text}")
+        rows = _PeriodRows(key)
+        for data in response.iter_content(chunk_size):
+            rows.feed(data)
+        return rows.close()
+    finally:
+        response.close()
+
+
+async def _afetch_rows(api, phone: str, endpoint: Endpoint, params: Dict, key: Optional[str],
+                       chunk_size: int = 64 * 1024) -> List:
+    full_url, host, target, authorized, template = api._resolve_target(endpoint, params, None)
+    response = await api._request_target(phone, endpoint.method, full_url, host, target, authorized=authorized,
+                                         template=template, stream=True)
+    try:
+        if response.status_code != 200:
+            await response.aread()
+            raise ValueError(f"Ошибка выгрузки: {response.status_code} - {response.text}")
+        rows = _PeriodRows(key)
+        async for data in response.aiter_bytes(chunk_size):
+            rows.feed(data)
+        return rows.close()
+    finally:
+        await response.aclose()
+
+
+#куда пишутся строки выгрузки. write_chunk пишет строки периода и отметку о том, что он готов,
+#так, что после падения период либо есть целиком, либо его нет совсем - на этом держится докачка
+class ExportSink:
+    def completed(self, export: str) -> Set[Chunk]:
+        raise NotImplementedError
+
+    def write_chunk(self, export: str, chunk: Chunk, rows: List):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+#строки в таблице table (по строке JSON на элемент), готовые периоды - в table_progress.
+#строки и отметка о периоде пишутся одной транзакцией
+class SQLiteExportSink(ExportSink):
+    def __init__(self, db_path: str, table: str = "export_rows", busy_timeout: float = 30.0):
+        if not _IDENTIFIER.match(table):
+            raise ValueError(f"Некорректное имя таблицы: {table}")
+        self.db_path = db_path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                export TEXT,
+                chunk_from TEXT,
+                chunk_to TEXT,
+                data TEXT
+            )
+        ''')
+        self._conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table}_progress (
+                export TEXT,
+                chunk_from TEXT,
+                chunk_to TEXT,
+                rows INTEGER,
+                done_at INTEGER,
+                PRIMARY KEY (export, chunk_from, chunk_to)
+            )
+        ''')
+
+    def completed(self, export: str) -> Set[Chunk]:
+        with self._lock:
+            cursor = self._conn.execute(
+                f'SELECT chunk_from, chunk_to FROM {self.table}_progress WHERE export = ?', (export,))
+            return {(row[0], row[1]) for row in cursor}
+
+    def write_chunk(self, export: str, chunk: Chunk, rows: List):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    f'INSERT INTO {self.table} (export, chunk_from, chunk_to, data) VALUES (?, ?, ?, ?)',
+                    ((export, chunk[0], chunk[1], json.dumps(row, ensure_ascii=False)) for row in rows))
+                self._conn.execute(
+                    f'INSERT OR REPLACE INTO {self.table}_progress VALUES (?, ?, ?, ?, ?)',
+                    (export, chunk[0], chunk[1], len(rows), int(time.time())))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def close(self):
+        self._conn.close()
+
+
+#строка JSON на элемент в path, готовые периоды - в path + ".progress" вместе с длиной файла после них.
+#при открытии хвост, дописанный после последней отметки (упали посреди периода), отрезается
+class NDJSONExportSink(ExportSink):
+    def __init__(self, path: str):
+        self.path = path
+        self.progress_path = path + ".progress"
+        self._lock = threading.Lock()
+        self._done: Dict[str, Set[Chunk]] = {}
+
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        offset = size
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path, "rb") as f:
+                marks = f.read()
+            #недописанную последнюю отметку выкидываем, иначе следующая допишется к ней в ту же строку
+            complete = marks[:marks.rfind(b"\n") + 1]
+            #отметки сверяем с файлом данных: если его удалили или обрезали, строк периода за его концом
+            #уже нет - такие отметки отрезаем, и периоды качаются заново
+            valid = 0
+            for line in complete.splitlines(keepends=True):
+                mark = json.loads(line)
+                if mark["offset"] > size:
+                    log.warning("Выгрузка %s: файл данных короче отметок (%s < %s байт), недостающие периоды качаем заново",
+                                path, size, mark["offset"])
+                    break
+                valid += len(line)
+                offset = mark["offset"]
+                if "export" in mark:
+                    self._done.setdefault(mark["export"], set()).add((mark["from"], mark["to"]))
+            if valid != len(marks):
+                os.truncate(self.progress_path, valid)
+            if size > offset:
+                log.info("Выгрузка %s: отрезаем недописанный период после %s байт", path, offset)
+                os.truncate(path, offset)
+
+        self._file = open(path, "ab")
+        self._progress = open(self.progress_path, "a", encoding='utf-8')
+        #первая отметка - с какого места файл наш, чтобы было до чего отрезать
+        self._mark({"offset": offset})
+
+    def _mark(self, mark: Dict):
+        self._progress.write(json.dumps(mark, ensure_ascii=False) + "\n")
+        self._progress.flush()
+        os.fsync(self._progress.fileno())
+
+    def completed(self, export: str) -> Set[Chunk]:
+        with self._lock:
+            return set(self._done.get(export, ()))
+
+    def write_chunk(self, export: str, chunk: Chunk, rows: List):
+        with self._lock:
+            for row in rows:
+                self._file.write(json.dumps(row, ensure_ascii=False).encode('utf-8') + b"\n")
+            self._file.flush()
+            #сначала строки на диске, потом отметка о периоде
+            os.fsync(self._file.fileno())
+            self._mark({"export": export, "from": chunk[0], "to": chunk[1], "rows": len(rows),
+                        "offset": self._file.tell()})
+            self._done.setdefault(export, set()).add(chunk)
+
+    def close(self):
+        self._file.close()
+        self._progress.close()
+
+
+#путь => sink по расширению: .db/.sqlite/.sqlite3 - SQLite, остальное - NDJSON
+def open_export_sink(dest: Union[str, ExportSink]) -> Tuple[ExportSink, bool]:
+    if isinstance(dest, ExportSink):
+        return dest, False
+    if os.path.splitext(dest)[1].lower() in (".db", ".sqlite", ".sqlite3"):
+        return SQLiteExportSink(dest), True
+    return NDJSONExportSink(dest), True
+
+
+#=> (имя выгрузки, периоды, которых еще нет в sink, вызовы (phone, endpoint, params) для них)
+def _plan(sink: ExportSink, phone: str, endpoint: Endpoint, start: Day, end: Day, chunk_days: int,
+          params: Optional[Dict], range_params: Tuple[str, str], date_format: str, name: Optional[str]):
+    if name is None:
+        query = encode_query(params)
+        name = f"{endpoint.name}:{phone}" + (f"?{query}" if query else "")
+    chunks = [(lo.strftime(date_format), hi.strftime(date_format)) for lo, hi in date_chunks(start, end, chunk_days)]
+    done = sink.completed(name)
+    pending = [chunk for chunk in chunks if chunk not in done]
+    if len(pending) < len(chunks):
+        log.info("Выгрузка %s: %s из %s периодов уже есть, докачиваем остальные", name,
+                 len(chunks) - len(pending), len(chunks))
+
+    base = dict(params or {})
+    calls = [(phone, endpoint, {**base, range_params[0]: lo, range_params[1]: hi}) for lo, hi in pending]
+    return name, pending, calls
+
+
+def _failed(name: str, chunk: Chunk, error: Exception):
+    from wbapi.api import ReauthRequired
+
+    #без сессии остальные периоды тоже не скачать
+    if isinstance(error, ReauthRequired):
+        raise error
+    log.warning("Выгрузка %s: период %s..%s не получен: %s", name, chunk[0], chunk[1], error)
+
+
+def _finish(name: str, failed: int, pending: List, rows: int) -> int:
+    if failed:
+        raise ValueError(f"Выгрузка {name}: не получено {failed} из {len(pending)} периодов, "
+                         f"повторный запуск докачает только их")
+    log.info("Выгрузка %s: %s периодов, %s строк", name, len(pending), rows)
+    return rows
+
+
+#выгрузка истории за [start, end] кусками по chunk_days дней: куски качаются параллельно (не больше
+#max_workers сразу, по умолчанию pool_maxsize), тело каждого разбирается потоково, готовые строки сразу
+#пишутся в sink (ExportSink или путь, см. open_export_sink) - в памяти только куски, которые еще в работе.
+#готовые периоды помнит sink, повторный запуск с тем же name качает только недостающие.
+#range_params: имена параметров периода (from/to, у transactions - date_from/date_to)
+#=> число записанных строк
+def export_range(api, phone: str, endpoint: Endpoint, start: Day, end: Day, sink, chunk_days: int = 7,
+                 params: Optional[Dict] = None, key: Optional[str] = None,
+                 range_params: Tuple[str, str] = ("from", "to"), date_format: str = "%Y-%m-%d",
+                 max_workers: Optional[int] = None, name: Optional[str] = None) -> int:
+    sink, owned = open_export_sink(sink)
+    try:
+        name, pending, calls = _plan(sink, phone, endpoint, start, end, chunk_days, params, range_params,
+                                     date_format, name)
+        fetch = lambda phone, endpoint, params: _fetch_rows(api, phone, endpoint, params, key)
+        rows = failed = 0
+        for index, items in iter_batch(api, calls, max_workers or api.pool_maxsize, True, fetch):
+            if isinstance(items, Exception):
+                _failed(name, pending[index], items)
+                failed += 1
+                continue
+            sink.write_chunk(name, pending[index], items)
+            rows += len(items)
+        return _finish(name, failed, pending, rows)
+    finally:
+        if owned:
+            sink.close()
+
+
+#то же для AsyncWBCourierAPI (не больше max_concurrency кусков сразу), запись в sink - в пуле потоков
+async def aexport_range(api, phone: str, endpoint: Endpoint, start: Day, end: Day, sink, chunk_days: int = 7,
+                        params: Optional[Dict] = None, key: Optional[str] = None,
+                        range_params: Tuple[str, str] = ("from", "to"), date_format: str = "%Y-%m-%d",
+                        max_concurrency: Optional[int] = None, name: Optional[str] = None) -> int:
+    sink, owned = await asyncio.to_thread(open_export_sink, sink)
+    try:
+        name, pending, calls = await asyncio.to_thread(_plan, sink, phone, endpoint, start, end, chunk_days,
+                                                       params, range_params, date_format, name)
+        fetch = lambda phone, endpoint, params: _afetch_rows(api, phone, endpoint, params, key)
+        rows = failed = 0
+        async for index, items in aiter_batch(api, calls, max_concurrency or api._limits.max_connections, True, fetch):
+            if isinstance(items, Exception):
+                _failed(name, pending[index], items)
+                failed += 1
+                continue
+            await asyncio.to_thread(sink.write_chunk, name, pending[index], items)
+            rows += len(items)
+        return _finish(name, failed, pending, rows)
+    finally:
+        if owned:
+            await asyncio.to_thread(sink.close)
@@ -0,0 +1,78 @@
+import atexit
+import logging
+import threading
+from typing import Optional, Dict, Tuple, Callable
+
+log = logging.getLogger("wbapi")
+
+
+#последние координаты по телефону. update_coordinates пишет только сюда, X-COORDINATES читается
+#отсюда же. interval <= 0 (по умолчанию) - в хранилище сразу при каждом обновлении, как раньше.
+#interval > 0 - одна последняя точка на телефон раз в interval секунд и в stop(); поток-демон
+#не переживает выход из процесса, поэтому stop() зарегистрирован и в atexit на случай забытого close()
+class PositionBuffer:
+    def __init__(self, write: Callable[[str, Dict], None], interval: float = 0.0):
+        self.write = write
+        self.interval = interval
+        self._positions: Dict[str, Tuple[float, float]] = {}
+        self._dirty: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        #две записи подряд не должны обогнать друг друга: старая точка поверх новой
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, phone: str) -> Optional[Tuple[float, float]]:
+        return self._positions.get(phone)
+
+    def update(self, phone: str, latitude: float, longitude: float):
+        #REAL-колонка вернет float, заголовки должны видеть то же самое
+        position = (float(latitude), float(longitude))
+        with self._lock:
+            self._positions[phone] = position
+            self._dirty[phone] = position
+            thread = None
+            if self.interval > 0 and self._thread is None and not self._stop.is_set():
+                thread = self._thread = threading.Thread(target=self._run, name="wb-positions", daemon=True)
+                thread.start()
+                atexit.register(self.stop)
+        if self.interval <= 0:
+            self.flush()
+
+    #забыть точку телефона: координаты записали в хранилище напрямую, они новее.
+    #идущий сброс дожидаемся, чтобы он не записал старую точку уже после прямой записи
+    def discard(self, phone: str):
+        with self._flush_lock:
+            with self._lock:
+                self._positions.pop(phone, None)
+                self._dirty.pop(phone, None)
+
+    #записать накопленное, вернуть сколько телефонов записано. не записанное остается на следующий раз
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._dirty = self._dirty, {}
+            written = 0
+            for phone, (latitude, longitude) in pending.items():
+                try:
+                    self.write(phone, {'latitude': latitude, 'longitude': longitude})
+                    written += 1
+                except Exception as e:
+                    log.warning("Не удалось сохранить координаты %s: %s", phone, e)
+                    with self._lock:
+                        #за это время могла прийти точка новее - ее не трогаем
+                        self._dirty.setdefault(phone, (latitude, longitude))
+            return written
+
+    def stop(self):
+        with self._lock:
+            self._stop.set()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            atexit.unregister(self.stop)
+            thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import random
+import threading
+from collections import deque
+from typing import Optional, Dict, List
+
+import requests
+
+from wbapi.api import ReauthRequired
+from wbapi.endpoints import MOBILE_API_END_POINT
+
+
+log = logging.getLogger("wbapi")
+
+
+#запас read timeout сверх delay: сервер держит long-poll запрос до delay секунд
+READ_MARGIN = 10.0
+
+
+#сообщения из ответа message/get: список или объект со списком в messages/data/items
+def extract_messages(payload) -> List[Dict]:
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for key in ("messages", "data", "items"):
+            value = payload.get(key)
+            if isinstance(value, (list, dict)):
+                return extract_messages(value)
+    return []
+
+
+def message_key(message) -> Optional[str]:
+    if not isinstance(message, dict):
+        return None
+    key = message.get("message_id", message.get("id"))
+    return None if key is None else str(key)
+
+
+#общее состояние подписки: последний message_id, отсев повторов, пауза после ошибок
+class _MessagePollerBase:
+    #delay: сколько секунд сервер держит запрос, если новых сообщений нет
+    #message_id: с какого сообщения начинать, None - с текущих
+    #backoff: (первая пауза, максимальная пауза) после ошибки, удваивается с джиттером
+    def __init__(self, api, phone: str, delay: int = 25, message_id: Optional[str] = None,
+                 enter_chat: Optional[str] = None, backoff: tuple = (1.0, 60.0), seen_limit: int = 1024):
+        self.api = api
+        self.phone = phone
+        self.delay = delay
+        self.message_id = message_id
+        self.enter_chat = enter_chat
+        self.backoff = backoff
+        self._seen = set()
+        self._seen_order = deque()
+        self._seen_limit = seen_limit
+        self._failures = 0
+
+    def _params(self) -> Dict:
+        params = {"lp": 1, "delay": self.delay}
+        if self.message_id is not None:
+            params["message_id"] = self.message_id
+        if self.enter_chat is not None:
+            params["enter_chat"] = self.enter_chat
+        return params
+
+    def _request_args(self):
+        return self.api._endpoint_request(MOBILE_API_END_POINT.call_center_message_get, self._params())
+
+    #новые сообщения из ответа, message_id сдвигается на последнее из них
+    def _accept(self, payload) -> List[Dict]:
+        self._failures = 0
+        fresh = []
+        for message in extract_messages(payload):
+            key = message_key(message)
+            if key is not None:
+                if key in self._seen:
+                    continue
+                self._seen.add(key)
+                self._seen_order.append(key)
+                if len(self._seen_order) > self._seen_limit:
+                    self._seen.discard(self._seen_order.popleft())
+                self.message_id = key
+            fresh.append(message)
+        return fresh
+
+    def _next_pause(self) -> float:
+        self._failures += 1
+        first, limit = self.backoff
+        pause = min(limit, first * 2 ** (self._failures - 1))
+        return random.uniform(pause / 2, pause)
+
+
+#синхронная подписка: for message in api.messages(phone): ...
+#stop() из другого потока прерывает цикл после текущего запроса
+class MessagePoller(_MessagePollerBase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self) -> List[Dict]:
+        full_url, host, target, kwargs = self._request_args()
+        timeout = (self.api.timeout[0], self.delay + READ_MARGIN)
+        #повторы и паузы - забота самого цикла: тихий long-poll переподключается сразу, без backoff клиента
+        response = self.api._request_target(self.phone, "GET", full_url, host, target, timeout=timeout,
+                                            retry=False, **kwargs)
+        if response.status_code in (204, 304):
+            return self._accept(None)
+        if response.status_code != 200:
+            raise ValueError(f"Ошибка получения сообщений: {response.status_code} - {response.text}")
+        return self._accept(response.json() if response.content else None)
+
+    def __iter__(self):
+        while not self._stop.is_set():
+            try:
+                messages = self.poll()
+            except requests.exceptions.ReadTimeout:
+                #сервер продержал запрос дольше delay - просто переподключаемся
+                continue
+            except ReauthRequired:
+                #сессии больше нет - повторять бесполезно, нужен новый вход
+                raise
+            except (requests.RequestException, ValueError) as e:
+                pause = self._next_pause()
+                log.warning("Ошибка long-poll сообщений %s: %s, повтор через %.1f с", self.phone, e, pause)
+                self._stop.wait(pause)
+                continue
+            yield from messages
+
+
+#то же самое для AsyncWBCourierAPI: async for message in api.messages(phone): ...
+class AsyncMessagePoller(_MessagePollerBase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    async def poll(self) -> List[Dict]:
+        import httpx
+
+        full_url, host, target, kwargs = self._request_args()
+        timeout = httpx.Timeout(self.delay + READ_MARGIN, connect=self.api.timeout[0])
+        response = await self.api._request_target(self.phone, "GET", full_url, host, target,
+                                                  timeout=timeout, retry=False, **kwargs)
+        if response.status_code in (204, 304):
+            return self._accept(None)
+        if response.status_code != 200:
+            raise ValueError(f"Ошибка получения сообщений: {response.status_code} - {response.text}")
+        return self._accept(response.json() if response.content else None)
+
+    async def __aiter__(self):
+        import httpx
+
+        while not self._stopped:
+            try:
+                messages = await self.poll()
+            except httpx.ReadTimeout:
+                continue
+            except ReauthRequired:
+                raise
+            except (httpx.HTTPError, ValueError) as e:
+                pause = self._next_pause()
+                log.warning("Ошибка long-poll сообщений %s: %s, повтор через %.1f с", self.phone, e, pause)
+                await asyncio.sleep(pause)
+                continue
+            for message in messages:
+                yield message
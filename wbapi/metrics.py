@@ -0,0 +1,162 @@
+import bisect
+import threading
+import time
+from typing import Optional, Dict, List, Tuple
+
+from wbapi.store import SessionStore
+
+
+#события, которые WBCourierAPI отдает подписчикам (api.add_hook(hook), hook(event, data)):
+#  request_start - host, endpoint, method, attempt
+#  request_end   - host, endpoint, method, attempt, status (None при сетевой ошибке), error, duration,
+#                  bytes_sent, bytes_received
+#  retry         - host, endpoint, method, attempt, reason, pause
+#  refresh       - phone, ok, duration
+#  store         - op, duration
+REQUEST_START = "request_start"
+REQUEST_END = "request_end"
+RETRY = "retry"
+REFRESH = "refresh"
+STORE = "store"
+
+#границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+#хранилище сессий с замером времени каждого обращения. WBCourierAPI оборачивает им store
+#при первом add_hook, без подписчиков обращения к базе не замеряются
+class TimedStore(SessionStore):
+    def __init__(self, store: SessionStore, emit):
+        self.store = store
+        self._emit = emit
+
+    def _timed(self, op: str, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._emit(STORE, {"op": op, "duration": time.perf_counter() - started})
+
+    def get_user(self, phone):
+        return self._timed("get_user", self.store.get_user, phone)
+
+    def create_user(self, row):
+        return self._timed("create_user", self.store.create_user, row)
+
+    def update_user(self, phone, data):
+        return self._timed("update_user", self.store.update_user, phone, data)
+
+    def sessions_to_renew(self, expires_before, now):
+        return self._timed("sessions_to_renew", self.store.sessions_to_renew, expires_before, now)
+
+    def acquire_refresh_lease(self, phone, owner, ttl):
+        return self._timed("acquire_refresh_lease", self.store.acquire_refresh_lease, phone, owner, ttl)
+
+    def release_refresh_lease(self, phone, owner):
+        return self._timed("release_refresh_lease", self.store.release_refresh_lease, phone, owner)
+
+    def close(self):
+        self.store.close()
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+#сборщик метрик в памяти процесса: api.add_hook(MetricsCollector()), collector.export() - текст для Prometheus
+class MetricsCollector:
+    _HISTOGRAMS = {
+        "wbapi_request_duration_seconds": ("Время HTTP-запроса", ("host", "endpoint", "method", "status")),
+        "wbapi_token_refresh_duration_seconds": ("Время обновления токена", ("result",)),
+        "wbapi_store_duration_seconds": ("Время обращения к хранилищу сессий", ("op",)),
+    }
+    _COUNTERS = {
+        "wbapi_request_errors_total": ("Сетевые ошибки запросов", ("host", "endpoint", "error")),
+        "wbapi_retries_total": ("Повторы запросов", ("host", "endpoint", "reason")),
+        "wbapi_request_bytes_total": ("Отправлено байт в телах запросов", ("host",)),
+        "wbapi_response_bytes_total": ("Получено байт в телах ответов", ("host",)),
+    }
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[str, Dict[Tuple, Histogram]] = {name: {} for name in self._HISTOGRAMS}
+        self._counters: Dict[str, Dict[Tuple, float]] = {name: {} for name in self._COUNTERS}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: str, data: Dict):
+        with self._lock:
+            if event == REQUEST_END:
+                host, endpoint = data["host"], data["endpoint"]
+                if data["status"] is None:
+                    self._inc("wbapi_request_errors_total", (host, endpoint, data["error"]))
+                else:
+                    self._observe("wbapi_request_duration_seconds",
+                                  (host, endpoint, data["method"], data["status"]), data["duration"])
+                self._inc("wbapi_request_bytes_total", (host,), data["bytes_sent"] or 0)
+                self._inc("wbapi_response_bytes_total", (host,), data["bytes_received"] or 0)
+            elif event == RETRY:
+                self._inc("wbapi_retries_total", (data["host"], data["endpoint"], data["reason"]))
+            elif event == REFRESH:
+                self._observe("wbapi_token_refresh_duration_seconds",
+                              ("ok" if data["ok"] else "error",), data["duration"])
+            elif event == STORE:
+                self._observe("wbapi_store_duration_seconds", (data["op"],), data["duration"])
+
+    def _observe(self, name: str, labels: Tuple, value: float):
+        series = self._histograms[name]
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def _inc(self, name: str, labels: Tuple, value: float = 1):
+        series = self._counters[name]
+        series[labels] = series.get(labels, 0) + value
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        names = self._HISTOGRAMS[name][1]
+        return self._histograms[name].get(tuple(labels.get(label) for label in names))
+
+    def reset(self):
+        with self._lock:
+            for series in (*self._histograms.values(), *self._counters.values()):
+                series.clear()
+
+    #текстовый формат экспозиции Prometheus
+    def export(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, (help_text, names) in self._HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for values, histogram in self._histograms[name].items():
+                    labels = _labels(names, values)
+                    cumulative = 0
+                    for bound, count in zip((*self.buckets, "+Inf"), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+            for name, (help_text, names) in self._COUNTERS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for values, value in self._counters[name].items():
+                    lines.append(f"{name}{{{_labels(names, values)}}} {value}")
+        return "\n".join(lines) + "\n"
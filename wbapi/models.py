@@ -0,0 +1,226 @@
+import codecs
+import json
+from typing import Optional, Dict, List, Iterable, Union
+
+#быстрый JSON, если установлен: pip install orjson
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[bytes, str]):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+#компактная запись вместо словаря: только нужные поля, в __slots__, без __dict__ на каждый объект
+class Record:
+    __slots__ = ()
+    _fields: tuple = ()
+    _keys: tuple = ()
+
+    def __init__(self, **values):
+        for field in self._fields:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Record":
+        obj = cls.__new__(cls)
+        get = data.get
+        for field, key in zip(cls._fields, cls._keys):
+            setattr(obj, field, get(key))
+        return obj
+
+    def to_dict(self) -> Dict:
+        return {key: getattr(self, field) for field, key in zip(self._fields, self._keys)}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(getattr(self, f) == getattr(other, f) for f in self._fields)
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in self._fields)
+        return f"{type(self).__name__}({values})"
+
+
+#класс записи по списку полей. fields - имена ключей JSON или {атрибут: ключ JSON}
+#ex: Task = record("Task", ("id", "price", "address")); Task.from_dict(item).price
+def record(name: str, fields: Union[Iterable[str], Dict[str, str]]) -> type:
+    mapping = dict(fields) if isinstance(fields, dict) else {field: field for field in fields}
+    attributes = tuple(mapping)
+    return type(name, (Record,), {"__slots__": attributes, "_fields": attributes, "_keys": tuple(mapping.values())})
+
+
+#массив из целого ответа: сам ответ, если это массив, иначе значение key (None - первый массив в объекте)
+def find_array(payload, key: Optional[str] = None) -> List:
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        if key is not None:
+            value = payload.get(key)
+            if isinstance(value, list):
+                return value
+        else:
+            for value in payload.values():
+                if isinstance(value, list):
+                    return value
+    raise ValueError(f"В ответе нет массива{f' {key}' if key else ''}")
+
+
+#разбор целого ответа (requests/httpx) => список словарей или записей model
+def parse_items(response, key: Optional[str] = None, model: Optional[type] = None) -> List:
+    items = find_array(loads(response.content), key)
+    if model is None:
+        return items
+    from_dict = model.from_dict
+    return [from_dict(item) for item in items]
+
+
+_WHITESPACE = " \t\r\n"
+_START, _KEY, _COLON, _VALUE, _NEXT_KEY, _ITEM, _NEXT_ITEM, _DONE = range(8)
+_MORE = object()
+
+
+#потоковый разбор массива: куски тела подаются в feed() по мере прихода, готовые элементы
+#возвращаются сразу. целиком в памяти держится только недочитанный хвост, а не весь ответ.
+#массив ищется так же, как в find_array: корень или поле key верхнего объекта
+class JSONArrayParser:
+    def __init__(self, key: Optional[str] = None):
+        self.key = key
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ""
+        self._pos = 0
+        self._state = _START
+        self._current_key = None
+        self._eof = False
+
+    def feed(self, data: bytes) -> List:
+        self._buffer += self._utf8.decode(data)
+        return self._drain()
+
+    #массив уже найден: дальше в теле только его элементы
+    @property
+    def in_array(self) -> bool:
+        return self._state in (_ITEM, _NEXT_ITEM, _DONE)
+
+    def close(self) -> List:
+        self._buffer += self._utf8.decode(b"", final=True)
+        self._eof = True
+        items = self._drain()
+        if self._state != _DONE:
+            raise ValueError("Ответ оборвался: массив не закрыт")
+        return items
+
+    #следующее значение целиком или _MORE, если оно еще не пришло
+    def _value(self):
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as e:
+            if self._eof:
+                raise ValueError(f"Некорректный JSON в ответе: {e}") from None
+            return _MORE
+        #число на краю куска могло оборваться на середине ("3" из "3.5", "3." из "3.5")
+        if (not self._eof and isinstance(value, (int, float)) and not isinstance(value, bool)
+                and (end == len(self._buffer) or self._buffer[end] in "0123456789.eE+-")):
+            return _MORE
+        self._pos = end
+        return value
+
+    def _unexpected(self, char: str, expected: str):
+        raise ValueError(f"Некорректный JSON в ответе: ожидалось {expected}, получено {char!r}")
+
+    def _drain(self) -> List:
+        items = []
+        buffer = self._buffer
+        while self._state != _DONE:
+            while self._pos < len(buffer) and buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos >= len(buffer):
+                break
+            char = buffer[self._pos]
+            state = self._state
+
+            if state == _START:
+                if char == '[':
+                    self._state = _ITEM
+                elif char == '{':
+                    self._state = _KEY
+                else:
+                    self._unexpected(char, "массив или объект")
+                self._pos += 1
+            elif state == _KEY:
+                if char == '}':
+                    raise ValueError(f"В ответе нет массива{f' {self.key}' if self.key else ''}")
+                key = self._value()
+                if key is _MORE:
+                    break
+                self._current_key = key
+                self._state = _COLON
+            elif state == _COLON:
+                if char != ':':
+                    self._unexpected(char, "':'")
+                self._pos += 1
+                self._state = _VALUE
+            elif state == _VALUE:
+                if char == '[' and (self.key is None or self._current_key == self.key):
+                    self._pos += 1
+                    self._state = _ITEM
+                #чужое поле пропускаем целиком
+                elif self._value() is _MORE:
+                    break
+                else:
+                    self._state = _NEXT_KEY
+            elif state == _NEXT_KEY:
+                if char == ',':
+                    self._pos += 1
+                    self._state = _KEY
+                else:
+                    raise ValueError(f"В ответе нет массива{f' {self.key}' if self.key else ''}")
+            elif state == _ITEM:
+                if char == ']':
+                    self._pos += 1
+                    self._state = _DONE
+                    continue
+                item = self._value()
+                if item is _MORE:
+                    break
+                items.append(item)
+                self._state = _NEXT_ITEM
+            elif state == _NEXT_ITEM:
+                if char == ',':
+                    self._state = _ITEM
+                elif char == ']':
+                    self._state = _DONE
+                else:
+                    self._unexpected(char, "',' или ']'")
+                self._pos += 1
+
+        #разобранное начало буфера больше не нужно
+        if self._pos > 64 * 1024:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        return items
+
+
+#куски байт (iter_content) => элементы массива по одному
+def iter_json_array(chunks: Iterable[bytes], key: Optional[str] = None, model: Optional[type] = None):
+    parser = JSONArrayParser(key)
+    convert = model.from_dict if model is not None else None
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield convert(item) if convert else item
+    for item in parser.close():
+        yield convert(item) if convert else item
+
+
+#то же для async-итератора кусков (httpx aiter_bytes)
+async def aiter_json_array(chunks, key: Optional[str] = None, model: Optional[type] = None):
+    parser = JSONArrayParser(key)
+    convert = model.from_dict if model is not None else None
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield convert(item) if convert else item
+    for item in parser.close():
+        yield convert(item) if convert else item
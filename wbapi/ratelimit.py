@@ -0,0 +1,58 @@
+import threading
+import time
+from typing import Optional, Dict, Tuple
+
+
+#token bucket: rate токенов в секунду, не больше burst про запас.
+#reserve() сразу списывает токен (баланс может уйти в минус) и говорит, сколько подождать,
+#поэтому ожидающие выстраиваются в очередь без повторных проверок
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+#ограничение исходящих запросов по хосту и по телефону.
+#per_host: хост => (rate, burst), "*" - для всех остальных хостов. per_phone: (rate, burst) для каждого телефона
+#ex: RateLimiter({"r-point.wb.ru": (5, 10), "*": (20, 20)}, per_phone=(2, 5))
+class RateLimiter:
+    def __init__(self, per_host: Optional[Dict[str, Tuple[float, float]]] = None,
+                 per_phone: Optional[Tuple[float, float]] = None):
+        self.per_host = per_host or {}
+        self.per_phone = per_phone
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str, limits: Optional[Tuple[float, float]]) -> Optional[TokenBucket]:
+        if limits is None:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(key, TokenBucket(*limits))
+        return bucket
+
+    #сколько секунд подождать перед запросом к host от phone (токены уже списаны)
+    def reserve(self, host: str, phone: Optional[str] = None) -> float:
+        pause = 0.0
+        host_limits = self.per_host.get(host, self.per_host.get("*"))
+        #общий "*" - отдельное ведро на каждый хост
+        bucket = self._bucket(f"host {host}", host_limits)
+        if bucket is not None:
+            pause = bucket.reserve()
+        if phone is not None:
+            bucket = self._bucket(f"phone {phone}", self.per_phone)
+            if bucket is not None:
+                pause = max(pause, bucket.reserve())
+        return pause
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import logging
+
+log = logging.getLogger("wbapi")
+
+
+#фоновое обновление токенов: раз в interval секунд смотрит access_expires_at в таблице users
+#и обновляет все сессии, которым осталось жить меньше margin секунд.
+#refresh идет через обычный single-flight _refresh_token, поэтому гонок с запросами нет
+class TokenRenewer:
+    def __init__(self, api, margin: int = 300, interval: float = 30.0):
+        self.api = api
+        self.margin = margin
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="wb-token-renewer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def renew_due(self):
+        for phone in self.api._sessions_to_renew(self.margin):
+            try:
+                self.api._refresh_token(phone, min_ttl=self.margin)
+            except Exception as e:
+                log.warning("Не удалось заранее обновить токен %s: %s", phone, e)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.renew_due()
+            except Exception as e:
+                log.exception("Ошибка фонового обновления токенов: %s", e)
+            self._stop.wait(self.interval)
+
+
+#то же самое для AsyncWBCourierAPI: задача в текущем event loop
+class AsyncTokenRenewer:
+    def __init__(self, api, margin: int = 300, interval: float = 30.0):
+        self.api = api
+        self.margin = margin
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def renew_due(self):
+        phones = await asyncio.to_thread(self.api._sessions_to_renew, self.margin)
+        for phone in phones:
+            try:
+                await self.api._refresh_token(phone, min_ttl=self.margin)
+            except Exception as e:
+                log.warning("Не удалось заранее обновить токен %s: %s", phone, e)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.renew_due()
+            except Exception as e:
+                log.exception("Ошибка фонового обновления токенов: %s", e)
+            await asyncio.sleep(self.interval)
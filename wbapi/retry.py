@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, List
+
+
+#методы, которые можно безопасно отправить повторно
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+#ответы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+#хост помечен как лежащий, запрос даже не отправлялся
+class CircuitOpenError(ValueError):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Хост {host} недоступен, повторите через {retry_in:.1f} с")
+        self.host = host
+        self.retry_in = retry_in
+
+
+#Retry-After: секунды или HTTP-дата => сколько ждать, None если заголовка нет или он кривой
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+#когда и сколько ждать перед повтором. идемпотентные методы повторяются после сетевых ошибок и RETRY_STATUSES,
+#остальные (POST) - только если сервер точно не начал обработку: соединение не установилось или ответ 429
+class RetryPolicy:
+    #attempts: сколько всего попыток, включая первую
+    #backoff, max_backoff: пауза растет как backoff * 2^n, не больше max_backoff, берется случайная в [0, пауза]
+    #max_retry_after: если сервер просит ждать дольше, не повторяем и отдаем ответ как есть
+    def __init__(self, attempts: int = 3, backoff: float = 0.5, max_backoff: float = 30.0,
+                 statuses=RETRY_STATUSES, methods=IDEMPOTENT_METHODS, max_retry_after: float = 60.0):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(methods)
+        self.max_retry_after = max_retry_after
+
+    #attempt - номер неудавшейся попытки, с нуля
+    def retry_status(self, method: str, status: int, attempt: int) -> bool:
+        if attempt + 1 >= self.attempts or status not in self.statuses:
+            return False
+        return method in self.methods or status == 429
+
+    #connect_failed: запрос не ушел на сервер (не удалось подключиться)
+    def retry_error(self, method: str, connect_failed: bool, attempt: int) -> bool:
+        if attempt + 1 >= self.attempts:
+            return False
+        return method in self.methods or connect_failed
+
+    #пауза перед следующей попыткой, None - сервер просит ждать слишком долго
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+        pause = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        requested = parse_retry_after(retry_after)
+        if requested is None:
+            return pause
+        if requested > self.max_retry_after:
+            return None
+        return max(requested, pause)
+
+
+#размыкатель по хостам: после failure_threshold ошибок подряд хост считается лежащим,
+#запросы к нему сразу падают с CircuitOpenError. через recovery_time пропускается один пробный запрос:
+#успех замыкает цепь, ошибка снова размыкает на recovery_time
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        #host => [ошибок подряд, когда разомкнули (или пустили пробный запрос)]
+        self._hosts: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def before(self, host: str):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state[0] < self.failure_threshold:
+                return
+            now = time.monotonic()
+            retry_in = state[1] + self.recovery_time - now
+            if retry_in > 0:
+                raise CircuitOpenError(host, retry_in)
+            #пробный запрос: остальные ждут его результата еще recovery_time
+            state[1] = now
+
+    def success(self, host: str):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def failure(self, host: str):
+        with self._lock:
+            state = self._hosts.setdefault(host, [0, 0.0])
+            state[0] += 1
+            if state[0] >= self.failure_threshold:
+                state[1] = time.monotonic()
+
+    def is_open(self, host: str) -> bool:
+        with self._lock:
+            state = self._hosts.get(host)
+            return state is not None and state[0] >= self.failure_threshold
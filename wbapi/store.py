@@ -0,0 +1,252 @@
+import sqlite3
+import threading
+import time
+import weakref
+from functools import lru_cache
+from typing import Optional, Dict, List
+
+
+#колонки таблицы users, других в UPDATE не пускаем
+USER_COLUMNS = (
+    'phone', 'device_uuid', 'device_name', 'latitude', 'longitude',
+    'access_token', 'refresh_token', 'access_expires_at', 'refresh_expires_at',
+    'created_at', 'updated_at'
+)
+
+
+#хранилище сессий (строки users + аренды на refresh) за WBCourierAPI
+class SessionStore:
+    def get_user(self, phone: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    #row - полная строка users
+    def create_user(self, row: Dict):
+        raise NotImplementedError
+
+    def update_user(self, phone: str, data: Dict):
+        raise NotImplementedError
+
+    #телефоны, у которых access токен истекает до expires_before, а refresh жив на момент now
+    def sessions_to_renew(self, expires_before: int, now: int) -> List[str]:
+        raise NotImplementedError
+
+    def acquire_refresh_lease(self, phone: str, owner: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def release_refresh_lease(self, phone: str, owner: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+#все в памяти процесса: для тестов и одиночных воркеров, которым не нужна база на диске
+class MemorySessionStore(SessionStore):
+    def __init__(self):
+        self._users: Dict[str, Dict] = {}
+        self._leases: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get_user(self, phone: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._users.get(phone)
+            return dict(row) if row is not None else None
+
+    def create_user(self, row: Dict):
+        with self._lock:
+            if row['phone'] in self._users:
+                raise sqlite3.IntegrityError(f"UNIQUE constraint failed: users.phone ({row['phone']})")
+            self._users[row['phone']] = dict(row)
+
+    def update_user(self, phone: str, data: Dict):
+        with self._lock:
+            row = self._users.get(phone)
+            if row is not None:
+                row.update(data)
+
+    def sessions_to_renew(self, expires_before: int, now: int) -> List[str]:
+        with self._lock:
+            return [
+                phone for phone, row in self._users.items()
+                if row['access_token'] is not None
+                and row['access_expires_at'] <= expires_before
+                and row['refresh_expires_at'] > now
+            ]
+
+    def acquire_refresh_lease(self, phone: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            lease = self._leases.get(phone)
+            if lease is not None and lease[1] >= now:
+                return False
+            self._leases[phone] = (owner, now + ttl)
+            return True
+
+    def release_refresh_lease(self, phone: str, owner: str):
+        with self._lock:
+            lease = self._leases.get(phone)
+            if lease is not None and lease[0] == owner:
+                del self._leases[phone]
+
+
+#версионированные миграции схемы, номер текущей лежит в PRAGMA user_version.
+#первые две совпадают с тем, что раньше создавалось через CREATE TABLE IF NOT EXISTS,
+#поэтому старые базы просто догоняются до последней версии
+MIGRATIONS = (
+    #1: пользователи
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        phone TEXT PRIMARY KEY,
+        device_uuid TEXT,
+        device_name TEXT,
+        latitude REAL,
+        longitude REAL,
+        access_token TEXT,
+        refresh_token TEXT,
+        access_expires_at INTEGER,
+        refresh_expires_at INTEGER,
+        created_at INTEGER,
+        updated_at INTEGER
+    )
+    ''',
+    #2: аренды single-flight refresh
+    '''
+    CREATE TABLE IF NOT EXISTS refresh_locks (
+        phone TEXT PRIMARY KEY,
+        owner TEXT,
+        expires_at REAL
+    )
+    ''',
+    #3: индекс для фонового обновления токенов
+    '''
+    CREATE INDEX IF NOT EXISTS users_access_expires_at ON users (access_expires_at)
+    ''',
+)
+
+_SELECT_USER = 'SELECT * FROM users WHERE phone = ?'
+_INSERT_USER = f'''
+    INSERT INTO users ({', '.join(USER_COLUMNS)})
+    VALUES ({', '.join('?' * len(USER_COLUMNS))})
+'''
+_SELECT_TO_RENEW = '''
+    SELECT phone FROM users
+    WHERE access_token IS NOT NULL
+      AND access_expires_at <= ?
+      AND refresh_expires_at > ?
+'''
+_ACQUIRE_LEASE = '''
+    INSERT INTO refresh_locks (phone, owner, expires_at) VALUES (?, ?, ?)
+    ON CONFLICT(phone) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+    WHERE refresh_locks.expires_at < ?
+'''
+_RELEASE_LEASE = 'DELETE FROM refresh_locks WHERE phone = ? AND owner = ?'
+
+
+#UPDATE собирается один раз на набор колонок: текст запроса стабилен,
+#и sqlite3 берет уже скомпилированный statement из своего кэша соединения
+@lru_cache(maxsize=64)
+def _update_sql(columns: tuple) -> str:
+    for column in columns:
+        if column not in USER_COLUMNS or column == 'phone':
+            raise ValueError(f"Неизвестная колонка users: {column}")
+    return f"UPDATE users SET {', '.join(f'{column} = ?' for column in columns)} WHERE phone = ?"
+
+
+#соединение потока в его threading.local. когда поток завершается, local отпускает держателя
+#и finalize закрывает соединение - короткоживущие потоки (пулы api.batch) не копят открытые базы
+class _ThreadConnection:
+    __slots__ = ("conn", "close", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.close = weakref.finalize(self, conn.close)
+
+
+#по соединению SQLite на поток: WAL (читатели не ждут писателя), autocommit,
+#busy_timeout вместо мгновенного "database is locked". общее для хранилища сессий и кэша ответов
+class ThreadConnections:
+    def __init__(self, db_path: str, busy_timeout: float = 30.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        #слабые ссылки: реестр нужен только close(), жизнь соединения он не продлевает
+        self._holders: "weakref.WeakSet[_ThreadConnection]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def get(self) -> sqlite3.Connection:
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            #autocommit: каждая запись - своя короткая транзакция, блокировка не висит между вызовами
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            holder = self._local.holder = _ThreadConnection(conn)
+            with self._lock:
+                self._holders.add(holder)
+        return holder.conn
+
+    def close(self):
+        with self._lock:
+            holders = list(self._holders)
+            self._holders.clear()
+        for holder in holders:
+            holder.close()
+        self._local = threading.local()
+
+
+#SQLite для нескольких процессов на одном файле, соединения - ThreadConnections
+class SQLiteSessionStore(SessionStore):
+    #busy_timeout: сколько секунд ждать чужую запись, прежде чем упасть
+    def __init__(self, db_path: str = "wb_courier.db", busy_timeout: float = 30.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._connections = ThreadConnections(db_path, busy_timeout)
+        self._migrate()
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def _migrate(self):
+        conn = self._connection()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= len(MIGRATIONS):
+            return
+
+        #BEGIN IMMEDIATE - миграцию делает только один процесс, остальные ждут и видят новую версию
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for number, sql in enumerate(MIGRATIONS[version:], start=version + 1):
+                conn.execute(sql)
+                conn.execute(f'PRAGMA user_version = {number}')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get_user(self, phone: str) -> Optional[Dict]:
+        row = self._connection().execute(_SELECT_USER, (phone,)).fetchone()
+        return dict(row) if row else None
+
+    def create_user(self, row: Dict):
+        self._connection().execute(_INSERT_USER, tuple(row.get(column) for column in USER_COLUMNS))
+
+    def update_user(self, phone: str, data: Dict):
+        columns = tuple(data)
+        self._connection().execute(_update_sql(columns), (*data.values(), phone))
+
+    def sessions_to_renew(self, expires_before: int, now: int) -> List[str]:
+        return [row[0] for row in self._connection().execute(_SELECT_TO_RENEW, (expires_before, now))]
+
+    def acquire_refresh_lease(self, phone: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        cursor = self._connection().execute(_ACQUIRE_LEASE, (phone, owner, now + ttl, now))
+        return cursor.rowcount == 1
+
+    def release_refresh_lease(self, phone: str, owner: str):
+        self._connection().execute(_RELEASE_LEASE, (phone, owner))
+
+    def close(self):
+        self._connections.close()
@@ -0,0 +1,122 @@
+import io
+import os
+import uuid
+from typing import Dict, Union, Tuple, Callable, BinaryIO
+
+
+#значение поля multipart: строка/байты/memoryview или (имя файла, данные или открытый файл, content-type)
+MultipartValue = Union[str, bytes, memoryview, Tuple[str, Union[bytes, memoryview, BinaryIO], str]]
+
+
+#multipart/form-data тело, которое не собирается в памяти целиком.
+#байты и memoryview отдаются срезами без копирования, файлы читаются кусками в один переиспользуемый буфер.
+#длина считается заранее, поэтому запрос уходит с Content-Length, а не chunked.
+#requests/urllib3 читают тело через read(), httpx.AsyncClient - через async_body()
+class MultipartStream:
+    #chunk_size: сколько читать из файла за раз
+    def __init__(self, fields: Dict[str, MultipartValue], chunk_size: int = 64 * 1024, boundary: str = None):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._parts = []
+        self._length = 0
+
+        for name, value in fields.items():
+            if isinstance(value, tuple):
+                filename, data, content_type = value
+                header = (f'--{self.boundary}\r\n'
+                          f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                          f'Content-Type: {content_type}\r\n\r\n')
+            else:
+                data = value.encode('utf-8') if isinstance(value, str) else value
+                header = (f'--{self.boundary}\r\n'
+                          f'Content-Disposition: form-data; name="{name}"\r\n\r\n')
+            self._add(memoryview(header.encode('utf-8')))
+            self._add(data if hasattr(data, 'read') else memoryview(data))
+            self._add(memoryview(b'\r\n'))
+        self._add(memoryview(f'--{self.boundary}--\r\n'.encode('utf-8')))
+
+        self._positions = [part.tell() for part in self._parts if not isinstance(part, memoryview)]
+        self._iterator = None
+
+    #вернуть поток в начало, чтобы отправить тело еще раз (повтор после 401)
+    def rewind(self):
+        files = (part for part in self._parts if not isinstance(part, memoryview))
+        for part, position in zip(files, self._positions):
+            part.seek(position)
+        self._iterator = None
+
+    def _add(self, part):
+        if isinstance(part, memoryview):
+            self._length += part.nbytes
+        else:
+            #файл: отправляем от текущей позиции до конца
+            position = part.tell()
+            try:
+                size = os.fstat(part.fileno()).st_size
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                size = part.seek(0, io.SEEK_END)
+                part.seek(position)
+            self._length += size - position
+        self._parts.append(part)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": self.content_type, "Content-Length": str(self._length)}
+
+    def __iter__(self):
+        buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
+        for part in self._parts:
+            if isinstance(part, memoryview):
+                for start in range(0, part.nbytes, self.chunk_size):
+                    yield part[start:start + self.chunk_size]
+            elif hasattr(part, 'readinto'):
+                while True:
+                    read = part.readinto(buffer)
+                    if not read:
+                        break
+                    #буфер переиспользуется: кусок должен быть отправлен до следующей итерации
+                    yield view[:read]
+            else:
+                while True:
+                    chunk = part.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+
+    #тело для httpx.AsyncClient: у самого потока есть __iter__, и httpx принял бы его за синхронный
+    def async_body(self) -> "AsyncMultipartBody":
+        return AsyncMultipartBody(self)
+
+    #для urllib3: read(blocksize) до пустого ответа
+    def read(self, size: int = -1):
+        if self._iterator is None:
+            self._iterator = iter(self)
+        return next(self._iterator, b'')
+
+
+#async-обертка над MultipartStream. куски отдаем копией в bytes,
+#потому что буфер чтения файла переиспользуется, а транспорт может придержать кусок
+class AsyncMultipartBody:
+    def __init__(self, stream: MultipartStream):
+        self.stream = stream
+
+    def rewind(self):
+        self.stream.rewind()
+
+    async def __aiter__(self):
+        for chunk in self.stream:
+            yield bytes(chunk)
+
+
+#куда писать скачанный файл: путь, бинарный файл или функция, принимающая очередной кусок
+def open_sink(dest) -> Tuple[Callable, Callable]:
+    if callable(dest) and not hasattr(dest, 'write'):
+        return dest, lambda: None
+    if isinstance(dest, (str, os.PathLike)):
+        file = open(dest, 'wb')
+        return file.write, file.close
+    return dest.write, lambda: None